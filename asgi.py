@@ -0,0 +1,6 @@
+"""
+Asynchronous Server Gateway Interface (ASGI) entry point
+"""
+from service.asgi import create_asgi_app
+
+app = create_asgi_app()
@@ -0,0 +1,183 @@
+"""
+Load Test
+
+Starts the service once under gunicorn sync workers (WSGI) and once under
+uvicorn workers (ASGI) with the same number of worker processes, and
+measures the throughput and latency of the product read endpoints at
+increasing numbers of concurrent connections.
+
+Usage:
+    python -m benchmarks.load_test [--rows 10000] [--workers 1] [--threads 1]
+        [--concurrency 1,10,50,200] [--duration 10] [--database-uri URI]
+    python -m benchmarks.load_test --url http://localhost:8080 [--concurrency ...]
+
+With --url, an already running server is measured instead. The database
+defaults to $DATABASE_URI, or a temporary SQLite file; the ASGI mode is only
+meaningful on PostgreSQL, since SQLite has no async driver that avoids a
+thread per connection. The products table is dropped and recreated, so never
+point this at real data.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+SERVERS = {
+    "wsgi (gunicorn sync)": ["gunicorn", "wsgi:app"],
+    "asgi (uvicorn)": ["gunicorn", "--worker-class", "uvicorn.workers.UvicornWorker", "asgi:app"],
+}
+
+
+async def read_response(reader) -> tuple:
+    """Reads an HTTP/1.1 response and returns its status and whether the connection stays open"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed")
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+        elif name.lower() == "connection":
+            keep_alive = value.strip().lower() != "close"
+    await reader.readexactly(length)
+    return int(status_line.split()[1]), keep_alive
+
+
+async def client(url, paths, deadline, latencies, errors):
+    """Sends requests over one connection, reconnecting when the server closes it, until the deadline"""
+    parts = urlsplit(url)
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            path = random.choice(paths)
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n\r\n".encode())
+            code, keep_alive = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if code >= 400:
+                errors.append(code)
+        except (ConnectionError, asyncio.IncompleteReadError, OSError) as error:
+            errors.append(type(error).__name__)
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def measure(url, paths, concurrency, duration) -> dict:
+    """Runs concurrent clients for a duration and returns the throughput and latency percentiles"""
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[client(url, paths, deadline, latencies, errors) for _ in range(concurrency)])
+    latencies.sort()
+    return {
+        "requests/s": len(latencies) / duration,
+        "p50 ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99 ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "errors": len(errors),
+    }
+
+
+def report(title, url, paths, args):
+    """Prints the results of every concurrency level against a server"""
+    print(f"\n===== {title} =====")
+    print(f"{'connections':>12} {'requests/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for concurrency in args.concurrency:
+        result = asyncio.run(measure(url, paths, concurrency, args.duration))
+        print(
+            f"{concurrency:>12} {result['requests/s']:>12.1f} {result['p50 ms']:>10.1f} "
+            f"{result['p99 ms']:>10.1f} {result['errors']:>8}"
+        )
+
+
+def free_port() -> int:
+    """Returns a TCP port that nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_listening(port, process, timeout=30.0):
+    """Waits for a server to accept connections"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"The server did not listen on port {port} within {timeout} seconds")
+
+
+def run_server(command, args, paths):
+    """Starts a server, measures it and stops it"""
+    port = free_port()
+    options = ["--bind", f"127.0.0.1:{port}", "--workers", str(args.workers), "--threads", str(args.threads)]
+    # recycling workers would reset connections in the middle of the measurement
+    options += ["--max-requests", "0"]
+    with subprocess.Popen(command[:-1] + options + command[-1:], stderr=subprocess.DEVNULL) as process:
+        try:
+            wait_until_listening(port, process)
+            report(f"{' '.join(command)}", f"http://127.0.0.1:{port}", paths, args)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+def main():
+    """Runs the load test"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--url", help="Measure a running server instead of starting one per mode")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--concurrency", type=lambda value: [int(item) for item in value.split(",")], default=[1, 10, 50, 200])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--database-uri", default=os.getenv("DATABASE_URI"))
+    args = parser.parse_args()
+    if args.url:
+        report(args.url, args.url, ["/api/products?limit=20", "/api/products/1"], args)
+        return
+
+    os.environ["DATABASE_URI"] = args.database_uri or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    # gunicorn.conf.py sizes the pools from these, and the command line sets the rest
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    os.environ["GUNICORN_THREADS"] = str(args.threads)
+    # pylint: disable=import-outside-toplevel
+    from sqlalchemy import create_engine
+    from benchmarks.query_plans import seed
+    from service.models.models import Product
+
+    engine = create_engine(os.environ["DATABASE_URI"])
+    print(f"Seeding {args.rows} products into {engine.url.render_as_string()}")
+    seed(engine, args.rows)
+    Product.create_indexes(engine)
+    engine.dispose()
+    paths = ["/api/products?limit=20", "/api/products?category=books&sort=-price&limit=20"]
+    paths += [f"/api/products/{product_id}" for product_id in random.sample(range(1, args.rows + 1), min(args.rows, 100))]
+
+    print(f"{args.workers} worker(s) with {args.threads} thread(s) each, {args.duration:g} s per level")
+    for title, command in SERVERS.items():
+        print(f"\nStarting {title}", file=sys.stderr)
+        run_server(command, args, paths)
+
+
+if __name__ == "__main__":
+    main()
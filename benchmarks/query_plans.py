@@ -0,0 +1,119 @@
+"""
+Query Plan Benchmark
+
+Seeds a products table and prints the query plans and timings of the
+product listing queries before and after the declared indexes are created.
+
+Usage:
+    python -m benchmarks.query_plans [--rows 200000] [--database-uri URI]
+
+The database defaults to $DATABASE_URI, or a temporary SQLite file. The
+products table is dropped and recreated, so never point this at real data.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine, insert, select, text, tuple_
+from service.models.models import Product, ProductFilter, Status
+
+CATEGORIES = ["clothes", "shoes", "electronics", "books", "movies", "music", "games"]
+
+QUERIES = {
+    "category substring": {"category": "tron"},
+    "price range": {"price": "10-12"},
+    "rating range": {"rating": "9.5-"},
+    "likes range": {"likes": "990-"},
+}
+
+
+def seed(engine, rows: int):
+    """Recreates the products table without indexes and fills it with random rows"""
+    table = Product.__table__
+    indexes = set(table.indexes)
+    table.indexes.clear()
+    # the tables that the app creates with foreign keys to it go first
+    dependents = [other for other in table.metadata.sorted_tables if any(key.references(table) for key in other.foreign_keys)]
+    try:
+        table.metadata.drop_all(engine, tables=dependents + [table], checkfirst=True)
+        table.create(engine)
+    finally:
+        table.indexes.update(indexes)
+    with engine.begin() as connection:
+        for start in range(0, rows, 10000):
+            connection.execute(
+                insert(table),
+                [
+                    {
+                        "name": f"Product {number}",
+                        "img_url": f"https://example.com/{number}.jpg",
+                        "description": "A product",
+                        "price": round(random.uniform(0, 1000), 2),
+                        "rating": round(random.uniform(0, 9.9), 1),
+                        "category": random.choice(CATEGORIES),
+                        "status": random.choice(list(Status)),
+                        "likes": random.randint(0, 1000),
+                    }
+                    for number in range(start, min(start + 10000, rows))
+                ],
+            )
+
+
+def statements() -> dict:
+    """Returns the statements to explain, by description"""
+    table = Product.__table__
+    result = {
+        name: select(table).where(*ProductFilter.from_query(**query).clauses())
+        for name, query in QUERIES.items()
+    }
+    result["keyset page by likes"] = (
+        select(table)
+        .where(tuple_(table.c.likes, table.c.id) > tuple_(500, 0))
+        .order_by(table.c.likes, table.c.id)
+        .limit(20)
+    )
+    return result
+
+
+def explain(engine, title: str):
+    """Prints the plan and median run time of every statement"""
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN ANALYZE "
+    print(f"\n===== {title} =====")
+    with engine.connect() as connection:
+        for name, statement in statements().items():
+            sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = connection.execute(text(prefix + sql)).fetchall()
+            timings = []
+            for _ in range(5):
+                start = time.perf_counter()
+                connection.execute(statement).fetchall()
+                timings.append(time.perf_counter() - start)
+            print(f"\n--- {name}: {statistics.median(timings) * 1000:.2f} ms")
+            for row in plan:
+                print("   ", row[-1])
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--database-uri", default=os.getenv("DATABASE_URI"))
+    args = parser.parse_args()
+    uri = args.database_uri or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    engine = create_engine(uri)
+
+    print(f"Seeding {args.rows} products into {engine.url.render_as_string()}")
+    seed(engine, args.rows)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    explain(engine, "BEFORE: primary key only")
+    Product.create_indexes(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    explain(engine, "AFTER: declared indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Read Path Benchmark
+
+Times listing every Product and building the response documents through
+ORM Product instances against Core rows, and reports the peak memory of
+each with tracemalloc.
+
+Usage:
+    python -m benchmarks.read_path [--rows 50000] [--database-uri URI]
+
+The database defaults to $DATABASE_URI, or a temporary SQLite file. The
+products table is dropped and recreated, so never point this at real data.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+
+def measure(function) -> tuple:
+    """Returns the run time in seconds and the peak memory in bytes of a function"""
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    # tracing slows everything down, so the memory is measured in a second run
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--database-uri", default=os.getenv("DATABASE_URI"))
+    args = parser.parse_args()
+    os.environ["DATABASE_URI"] = args.database_uri or f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+
+    # pylint: disable=import-outside-toplevel
+    from wsgi import app
+    from benchmarks.query_plans import seed
+    from service.models.models import Product, db
+    from service.routes.routes import serialize_product
+
+    with app.app_context():
+        print(f"Seeding {args.rows} products into {db.engine.url.render_as_string()}")
+        seed(db.engine, args.rows)
+
+        def orm_instances():
+            products = Product.query_by().all()
+            documents = [serialize_product(product) for product in products]
+            db.session.remove()
+            return documents
+
+        def core_rows():
+            rows = db.session.execute(Product.select_by()).all()
+            documents = [serialize_product(row) for row in rows]
+            db.session.remove()
+            return documents
+
+        for name, function in {"ORM instances": orm_instances, "Core rows": core_rows}.items():
+            function()  # warm up the statement cache
+            elapsed, peak = measure(function)
+            db.session.remove()
+            print(f"  {name:14} {elapsed * 1000:8.1f} ms  {peak / 2**20:8.1f} MiB peak")
+
+
+if __name__ == "__main__":
+    main()
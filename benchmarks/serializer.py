@@ -0,0 +1,85 @@
+"""
+Serializer Benchmark
+
+Times building the JSON body of a list of Products the old way, with
+Product.serialize() followed by flask-restx marshalling and json.dumps,
+against the precompiled serializer and orjson.
+
+Usage:
+    python -m benchmarks.serializer [--items 10000] [--rounds 5]
+
+The app is created against $DATABASE_URI, or a temporary SQLite file; the
+benchmark itself never touches the database.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from flask_restx import marshal
+
+CATEGORIES = ["clothes", "shoes", "electronics", "books", "movies", "music", "games"]
+
+
+def products(count: int) -> list:
+    """Returns transient Products with random attributes"""
+    # pylint: disable=import-outside-toplevel
+    from service.models.models import Product, Status
+
+    return [
+        Product(
+            id=number,
+            name=f"Product {number}",
+            img_url=f"https://example.com/{number}.jpg",
+            description="A product",
+            price=round(random.uniform(0, 1000), 2),
+            rating=round(random.uniform(0, 9.9), 1),
+            category=random.choice(CATEGORIES),
+            status=random.choice(list(Status)),
+            likes=random.randint(0, 1000),
+            version=1,
+        )
+        for number in range(1, count + 1)
+    ]
+
+
+def measure(function, rounds: int) -> float:
+    """Returns the median run time of a function in seconds"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URI", f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+
+    # pylint: disable=import-outside-toplevel
+    from wsgi import app
+    from service.routes.routes import dumps, product_model, serialize_product
+
+    items = products(args.items)
+    with app.app_context():
+        before = measure(
+            lambda: json.dumps(marshal([product.serialize() for product in items], product_model)),
+            args.rounds,
+        )
+        after = measure(lambda: dumps([serialize_product(product) for product in items]), args.rounds)
+
+    print(f"Serializing {args.items} products, median of {args.rounds} rounds")
+    print(f"  serialize() + marshal + json: {before * 1000:8.2f} ms")
+    print(f"  precompiled + orjson:         {after * 1000:8.2f} ms")
+    print(f"  speedup:                      {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
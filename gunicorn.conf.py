@@ -0,0 +1,121 @@
+"""
+Gunicorn configuration
+
+Sizes the workers and threads of the server from the CPU and memory limits
+of the container's cgroup (v2, or v1 on older nodes), so a pod limited to
+half a CPU does not fork a process per host CPU. Every setting can be
+overridden with its environment variable:
+
+    WEB_CONCURRENCY            worker processes
+    GUNICORN_THREADS           threads per worker, more than 1 selects gthread
+    GUNICORN_WORKER_CLASS      worker class, e.g. uvicorn.workers.UvicornWorker
+    GUNICORN_WORKER_MEMORY     MiB that one worker needs (64)
+    GUNICORN_KEEPALIVE         seconds an idle keep-alive connection stays open (65)
+    GUNICORN_MAX_REQUESTS      requests before a worker is recycled, 0 never (1000)
+    GUNICORN_PRELOAD           build the app once before forking (true)
+
+The chosen WEB_CONCURRENCY and GUNICORN_THREADS are exported before the app
+is loaded, so the connection pool of every worker is sized to match.
+"""
+# gunicorn reads its settings from lowercase module variables
+# pylint: disable=invalid-name
+import math
+import os
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# cgroup v1 reports "no limit" as a page-aligned maximum instead of "max"
+UNLIMITED_BYTES = 2**60
+
+
+def read_value(path: str):
+    """Returns the stripped contents of a cgroup file, or None when it does not exist"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit(root: str = CGROUP_ROOT):
+    """Returns the number of CPUs that the cgroup may use, or None when it is not limited"""
+    quota_period = read_value(os.path.join(root, "cpu.max"))
+    if quota_period is not None:
+        quota, _, period = quota_period.partition(" ")
+    else:
+        quota = read_value(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+        period = read_value(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+    if quota in (None, "max", "-1") or not period:
+        return None
+    return int(quota) / int(period)
+
+
+def memory_limit(root: str = CGROUP_ROOT):
+    """Returns the bytes of memory that the cgroup may use, or None when it is not limited"""
+    limit = read_value(os.path.join(root, "memory.max"))
+    if limit is None:
+        limit = read_value(os.path.join(root, "memory", "memory.limit_in_bytes"))
+    if limit in (None, "max") or int(limit) >= UNLIMITED_BYTES:
+        return None
+    return int(limit)
+
+
+def available_cpus(root: str = CGROUP_ROOT) -> float:
+    """Returns the CPUs of the cgroup limit, or of the CPUs the process may run on"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    limit = cpu_limit(root)
+    return min(limit, cpus) if limit else cpus
+
+
+def autotune(cpus: float, memory, environ) -> dict:
+    """
+    Returns the worker class, workers and threads for the CPUs and memory of
+    a container
+
+    Below one CPU a single worker serves the requests on threads, since more
+    processes would only take turns on the same fraction of a CPU; otherwise
+    the usual 2 x CPUs + 1 workers are started. Either is capped by the
+    workers that fit in the memory limit.
+    """
+    if "WEB_CONCURRENCY" in environ:
+        processes = int(environ["WEB_CONCURRENCY"])
+    else:
+        processes = 1 if cpus < 1 else 2 * math.floor(cpus) + 1
+        if memory:
+            worker_memory = int(environ.get("GUNICORN_WORKER_MEMORY", "64")) * 2**20
+            processes = min(processes, max(memory // worker_memory, 1))
+    per_worker = int(environ.get("GUNICORN_THREADS", "4"))
+    class_name = environ.get("GUNICORN_WORKER_CLASS") or ("gthread" if per_worker > 1 else "sync")
+    return {"worker_class": class_name, "workers": max(processes, 1), "threads": max(per_worker, 1)}
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Drops the database connections that a worker inherited from the preloaded app"""
+    if not server.cfg.preload_app:
+        return
+    # pylint: disable=import-outside-toplevel
+    from service.models.models import db
+
+    application = worker.app.wsgi()
+    flask_app = getattr(application, "flask_app", application)
+    with flask_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+tuned = autotune(available_cpus(), memory_limit(), os.environ)
+os.environ["WEB_CONCURRENCY"] = str(tuned["workers"])
+os.environ["GUNICORN_THREADS"] = str(tuned["threads"])
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+worker_class = tuned["worker_class"]
+workers = tuned["workers"]
+threads = tuned["threads"]
+# longer than the 60 second idle timeout of the ingress, so it never reuses a closed connection
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "65"))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("true", "yes", "1")
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+# heartbeat files on tmpfs, so a slow overlay filesystem cannot stall the workers
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
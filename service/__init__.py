@@ -23,6 +23,7 @@ from flask import Flask
 from flask_restx import Api
 from service import config
 from service.common import log_handlers
+from service.common.startup import StartupTimer, wait_for_database
 from service.models import models
 
 
@@ -33,50 +34,69 @@ api = None  # pylint: disable=invalid-name
 ############################################################
 # Initialize the Flask instance
 ############################################################
-def create_app():
-    """Initialize the core application."""
+def create_app(asgi=False):
+    """
+    Initialize the core application. With asgi, the app runs behind the
+    ASGI app, whose async pool shares the connection budget of the worker.
+    """
+    timer = StartupTimer()
     # Create Flask application
     app = Flask(__name__)
     app.config.from_object(config)
+    # Set up logging for production
+    log_handlers.init_logging(app, "gunicorn.error")
 
     # Initialize Plugins
     # pylint: disable=import-outside-toplevel
     global api
-    api = Api(
-        app,
-        version="1.0.0",
-        title="Product REST API Service",
-        description="This is a Product service server.",
-        default="products",
-        default_label="Products service",
-        doc="/apidocs",  # default also could use doc='/apidocs/'
-        prefix="/api",
-    )
+    with timer.phase("api"):
+        api = Api(
+            app,
+            version="1.0.0",
+            title="Product REST API Service",
+            description="This is a Product service server.",
+            default="products",
+            default_label="Products service",
+            doc="/apidocs" if app.config["API_DOCS"] else False,  # default also could use doc='/apidocs/'
+            prefix="/api",
+        )
 
-    from service.models.models import db
+    from service.common.pool import asgi_budgets, engine_options
+    from service.models.models import db, cache, query_cache, pool_metrics, replicas
 
+    budget = asgi_budgets(app.config)[0] if asgi else None
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config, budget=budget))
     db.init_app(app)
+    cache.init_app(app)
+    query_cache.init_app(app)
 
     with app.app_context():
-        # Dependencies require we import the routes AFTER the Flask app is created
-        # pylint: disable=wrong-import-position, wrong-import-order, unused-import
-        from service.routes import routes  # noqa: F401 E402
-        from service.common import error_handlers, cli_commands  # noqa: F401, E402
+        with timer.phase("routes"):
+            # Dependencies require we import the routes AFTER the Flask app is created
+            # pylint: disable=wrong-import-position, wrong-import-order, unused-import
+            from service.routes import routes  # noqa: F401 E402
+            from service.common import error_handlers, cli_commands  # noqa: F401, E402
+
+        pool_metrics.listen(db.engine)
+        # every bind is a read replica of the primary database
+        replicas.init_app(app, [db.engines[key] for key in app.config["SQLALCHEMY_BINDS"]])
 
         try:
-            db.create_all()
+            with timer.phase("database"):
+                wait_for_database(db.engine, app.config, app.logger)
+            if app.config["DB_CREATE_ALL"]:
+                with timer.phase("schema"):
+                    db.create_all()
         except Exception as error:  # pylint: disable=broad-except
             app.logger.critical("%s: Cannot continue", error)
             # gunicorn requires exit code 4 to stop spawning workers when they die
             sys.exit(4)
 
-        # Set up logging for production
-        log_handlers.init_logging(app, "gunicorn.error")
-
         app.logger.info(70 * "*")
         app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
         app.logger.info(70 * "*")
 
+        app.logger.info(timer.summary())
         app.logger.info("Service initialized!")
 
         return app
@@ -0,0 +1,281 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Module: asgi
+
+An ASGI application that serves the product API with async handlers
+
+The read paths that carry most of the traffic, GET /api/products and
+GET /api/products/{id}, run as coroutines over an async database driver, so
+one worker keeps serving other connections while their queries are in
+flight. Every other request, and every read with options that the async
+handlers leave out (ids, q, invalid parameters and not found errors), is
+passed on to the Flask app on a pool of threads, so the API is the same in
+both serving modes.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import Headers
+from werkzeug.http import quote_etag
+from werkzeug.sansio.request import Request
+from service import create_app
+from service.common import status
+from service.common.cache import cache_lookups
+from service.common.pagination import decode_cursor, encode_cursor
+from service.common.pool import asgi_budgets, engine_options
+from service.common.replicas import is_pinned
+from service.common.serializer import dumps
+from service.models.models import DataValidationError, Product, ProductFilter, cache
+
+# The async drivers of the databases that the sync drivers are swapped for
+ASYNC_DRIVERS = {"postgresql": "postgresql+psycopg", "sqlite": "sqlite+aiosqlite"}
+
+# The query parameters of a listing that the async handler serves
+LIST_PARAMETERS = set(ProductFilter.FIELDS) | {"fields", "sort", "limit", "cursor"}
+
+
+class Delegate(Exception):
+    """Raised by an async handler to pass its request on to the Flask app"""
+
+
+def async_url(database_uri: str):
+    """Returns the URL of a database with the async driver of its dialect"""
+    url = make_url(database_uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+class ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """Runs one request of a WSGI application on a thread of an executor"""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    # the method it overrides is wrapped in sync_to_async, so it is awaited as well
+    async def run_wsgi_app(self, body):  # pylint: disable=invalid-overridden-method
+        await sync_to_async(self.respond, thread_sensitive=False, executor=self.executor)(body)
+
+    def respond(self, body):
+        """Calls the WSGI application and sends its response from the thread that started it"""
+        result = self.wsgi_application(self.build_environ(self.scope, body), self.start_response)
+        try:
+            for output in result:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                self.sync_send({"type": "http.response.body", "body": output, "more_body": True})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({"type": "http.response.body"})
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):  # pylint: disable=too-few-public-methods
+    """
+    Runs a WSGI application for an ASGI server on a pool of threads
+
+    asgiref runs every request on one shared thread by default, which would
+    serialize all of the requests that are passed on to the Flask app.
+    """
+
+    def __init__(self, wsgi_application, threads: int):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiToAsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class ProductASGI:
+    """The ASGI application of the product API"""
+
+    def __init__(self, flask_app):
+        # pylint: disable=import-outside-toplevel
+        from service.routes import routes
+
+        self.flask_app = flask_app
+        self.routes = routes
+        self.config = flask_app.config
+        self.wsgi = ThreadedWsgiToAsgi(flask_app, max(self.config["GUNICORN_THREADS"], 1))
+        options = engine_options(self.config, self.config["ASGI_DB_POOL_SIZE"], asgi_budgets(self.config)[1])
+        # async engines keep their own adapted queue pool
+        options.pop("poolclass", None)
+        self.engine = create_async_engine(async_url(self.config["SQLALCHEMY_DATABASE_URI"]), **options)
+        self.handlers = [
+            (re.compile(r"/api/products/?"), self.list_products),
+            (re.compile(r"/api/products/(\d+)"), self.get_product),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] == "http" and scope["method"] == "GET":
+            for pattern, handler in self.handlers:
+                match = pattern.fullmatch(scope["path"])
+                if match:
+                    try:
+                        response = await handler(make_request(scope), *match.groups())
+                    except Delegate:
+                        break
+                    await send_response(send, *response)
+                    return
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """Releases the database connections and threads when the server shuts down"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.wsgi.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def get_product(self, request, product_id):
+        """Returns a Product like GET /api/products/{id}"""
+        product_id = int(product_id)
+        fields = self.get_fields(request)
+        if request.if_none_match:
+            async with self.engine.connect() as connection:
+                statement = select(Product.version).where(Product.id == product_id)
+                version = (await connection.execute(statement)).scalar()
+            if version is not None and request.if_none_match.contains_weak(str(version)):
+                return status.HTTP_304_NOT_MODIFIED, b"", {"ETag": quote_etag(str(version))}
+
+        async def load():
+            async with self.engine.connect() as connection:
+                statement = select(Product.__table__).where(Product.id == product_id)
+                row = (await connection.execute(statement)).first()
+            return self.routes.serialize_product(row) if row else None
+
+        # like read_only(), a pinned read skips rows cached before the client's last write
+        token = cache_lookups.set(not is_pinned(request))
+        try:
+            product = await cache.get_or_load_async(product_id, load)
+        finally:
+            cache_lookups.reset(token)
+        if not product:
+            raise Delegate()
+        headers = {"ETag": quote_etag(str(product["version"]))}
+        if fields:
+            product = {name: product[name] for name in fields}
+        return status.HTTP_200_OK, dumps(product), headers
+
+    async def list_products(self, request):
+        """Returns Products like GET /api/products without ids or q"""
+        if not set(request.args).issubset(LIST_PARAMETERS):
+            raise Delegate()
+        fields = self.get_fields(request)
+        statement, columns, sort, limit = self.list_statement(request, fields)
+        async with self.engine.connect() as connection:
+            rows = (await connection.execute(statement)).all()
+        products, keyset = Product.keyset_page(rows, columns, limit)
+        headers = next_page_headers(request, sort, limit, keyset)
+        etag = self.routes.collection_etag(products, headers)
+        if request.if_none_match.contains_weak(etag):
+            return status.HTTP_304_NOT_MODIFIED, b"", {"ETag": quote_etag(etag, weak=True)}
+        headers["ETag"] = quote_etag(etag, weak=True)
+        serializer = self.routes.product_serializer(fields)
+        return status.HTTP_200_OK, dumps([serializer(product) for product in products]), headers
+
+    def list_statement(self, request, fields):
+        """Returns the statement of a page of a listing, the columns of its keyset, its sort order and its size"""
+        filters = {key: request.args[key] for key in ProductFilter.FIELDS if request.args.get(key)}
+        sort, limit, after = self.get_page(request.args)
+        try:
+            statement = Product.select_by(**filters)
+            if fields:
+                statement = statement.with_only_columns(*Product.columns_for(fields))
+            statement, columns = Product.keyset_statement(statement, sort, limit, after)
+        except DataValidationError as error:
+            raise Delegate() from error
+        return statement, columns, sort, limit
+
+    def get_fields(self, request):
+        """Returns the requested fields in product_model order, or None for all of them"""
+        if not request.args.get("fields"):
+            return None
+        fields = {name.strip() for name in request.args["fields"].split(",")} - {""}
+        resolved = self.routes.product_model.resolved
+        if not fields.issubset(resolved):
+            raise Delegate()
+        return tuple(name for name in resolved if name in fields)
+
+    def get_page(self, args):
+        """Returns the sort order, page size and keyset of a listing like paginate_products()"""
+        sort, after = args.get("sort") or "id", None
+        try:
+            if args.get("cursor"):
+                sort, after = decode_cursor(args["cursor"])
+                if args.get("sort") and args["sort"] != sort:
+                    raise Delegate()
+            limit = int(args["limit"]) if "limit" in args else self.config["PAGE_SIZE_DEFAULT"]
+        except (DataValidationError, ValueError) as error:
+            raise Delegate() from error
+        if limit < 1:
+            raise Delegate()
+        return sort, min(limit, self.config["PAGE_SIZE_MAX"]), after
+
+
+def next_page_headers(request, sort, limit, keyset) -> dict:
+    """Returns the headers that link a page to the next one like paginate_products()"""
+    if keyset is None:
+        return {}
+    cursor = encode_cursor(sort, keyset)
+    params = request.args.to_dict()
+    params.update(cursor=cursor, limit=limit)
+    return {"X-Next-Cursor": cursor, "Link": f'<{request.base_url}?{urlencode(params)}>; rel="next"'}
+
+
+def make_request(scope) -> Request:
+    """Returns a request with the query arguments and headers of an ASGI scope"""
+    return Request(
+        method=scope["method"],
+        scheme=scope.get("scheme", "http"),
+        server=scope.get("server"),
+        root_path=scope.get("root_path", ""),
+        path=scope["path"],
+        query_string=scope["query_string"],
+        headers=Headers([(name.decode("latin1"), value.decode("latin1")) for name, value in scope["headers"]]),
+        remote_addr=(scope.get("client") or (None,))[0],
+    )
+
+
+async def send_response(send, code, body, headers):
+    """Sends a response with a JSON body"""
+    raw_headers = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers.items()]
+    if code != status.HTTP_304_NOT_MODIFIED:
+        raw_headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": code, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_asgi_app():
+    """Creates the Flask app and the ASGI application that serves it"""
+    return ProductASGI(create_app(asgi=True))
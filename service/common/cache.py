@@ -0,0 +1,227 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Read-through Cache
+
+This module contains a read-through cache with hit/miss counters and the
+backends that store its entries. The in-process LRU backend is bounded in
+size and entries expire after a TTL. A shared cache can be added later by
+implementing CacheBackend and registering it in BACKENDS.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextvars import ContextVar
+
+MISSING = object()
+
+# Whether the reads of the current request may be answered from the caches,
+# and whether what they load may be stored in them. Reads pinned to the
+# primary skip the lookup, and reads from a lagging replica skip the store
+# (see service.common.replicas).
+cache_lookups = ContextVar("cache_lookups", default=True)
+cache_stores = ContextVar("cache_stores", default=True)
+
+
+class CacheBackend(ABC):
+    """Interface of the stores behind a Cache"""
+
+    @abstractmethod
+    def get(self, key):
+        """Returns the value stored for a key, or MISSING"""
+
+    @abstractmethod
+    def set(self, key, value):
+        """Stores a value for a key"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Removes the value stored for a key, if any"""
+
+    @abstractmethod
+    def clear(self):
+        """Removes all of the stored values"""
+
+    def __len__(self):
+        return 0
+
+
+class NullCache(CacheBackend):
+    """A backend that stores nothing, so every lookup is a miss"""
+
+    def get(self, key):
+        return MISSING
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """An in-process backend that evicts the least recently used entries"""
+
+    def __init__(self, max_size: int = 2000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Backends that can be selected with the CACHE_TYPE setting
+BACKENDS = {"none": NullCache, "memory": LRUCache}
+
+
+class Cache:
+    """
+    A read-through cache that counts its hits and misses
+
+    The cache stores nothing until init_app() selects a backend from the
+    CACHE_TYPE, CACHE_MAX_SIZE and CACHE_TTL settings of the app.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.backend = NullCache()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Selects the backend configured for the app"""
+        cache_type = app.config.get("CACHE_TYPE", "memory")
+        if cache_type not in BACKENDS:
+            raise ValueError(f"Unknown CACHE_TYPE {cache_type}, expected one of {', '.join(BACKENDS)}")
+        if cache_type == "memory":
+            self.backend = LRUCache(app.config.get("CACHE_MAX_SIZE", 2000), app.config.get("CACHE_TTL", 30.0))
+        else:
+            self.backend = BACKENDS[cache_type]()
+
+    def lookup(self, key):
+        """Returns the cached value of a key, or MISSING, and counts the hit or miss"""
+        value = self.backend.get(key) if cache_lookups.get() else MISSING
+        with self._lock:
+            if value is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def store(self, key, value):
+        """Caches the value of a key unless it is None or the request may not store"""
+        if value is not None and cache_stores.get():
+            self.backend.set(key, value)
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value of a key, or calls loader() on a miss and
+        caches what it returns unless that is None
+        """
+        value = self.lookup(key)
+        if value is MISSING:
+            value = loader()
+            self.store(key, value)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """
+        Returns the cached value of a key, or awaits loader() on a miss and
+        caches what it returns unless that is None
+        """
+        value = self.lookup(key)
+        if value is MISSING:
+            value = await loader()
+            self.store(key, value)
+        return value
+
+    def get_many_or_load(self, keys, loader):
+        """
+        Returns a dictionary of the cached values of keys, calling
+        loader(missing_keys) once for all misses
+
+        The loader returns a dictionary of the values it found, which are
+        cached unless they are None. Keys that are found nowhere are left
+        out of the result.
+        """
+        values, missing = {}, []
+        for key in keys:
+            value = self.backend.get(key) if cache_lookups.get() else MISSING
+            if value is MISSING:
+                missing.append(key)
+            else:
+                values[key] = value
+        with self._lock:
+            self.hits += len(values)
+            self.misses += len(missing)
+        if missing:
+            for key, value in loader(missing).items():
+                if value is not None:
+                    self.store(key, value)
+                    values[key] = value
+        return values
+
+    def invalidate(self, key):
+        """Removes a key so the next lookup loads it again"""
+        self.backend.delete(key)
+
+    def clear(self):
+        """Removes all keys"""
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and size of the cache"""
+        return {
+            "backend": type(self.backend).__name__,
+            "size": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -16,8 +16,13 @@
 """
 Flask CLI Command Extensions
 """
+import csv
+import itertools
+import json
+import time
+import click
 from flask import current_app as app  # Import Flask application
-from service.models.models import db
+from service.models.models import db, DataValidationError, Product, ProductLikeShard
 
 
 ######################################################################
@@ -34,3 +39,126 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to upgrade the schema of existing tables
+# Usage:
+#   flask db-upgrade
+######################################################################
+@app.cli.command("db-upgrade")
+def db_upgrade():
+    """
+    Creates the tables, columns and indexes declared on the models that are
+    missing from the database. Run it once per deploy when the app starts
+    with DB_CREATE_ALL=false.
+    """
+    db.create_all()
+    Product.add_missing_columns()
+    Product.create_indexes()
+
+
+######################################################################
+# Command to roll up sharded like counters
+# Usage:
+#   flask likes-rollup
+######################################################################
+@app.cli.command("likes-rollup")
+def likes_rollup():
+    """
+    Moves the likes of the sharded like counters into the products. Run it
+    periodically when LIKE_COUNTER_SHARDS is enabled.
+    """
+    likes = ProductLikeShard.rollup()
+    click.echo(f"Rolled up {likes} likes")
+
+
+######################################################################
+# Command to bulk load products from files
+# Usage:
+#   flask products-import [--format csv|ndjson] [--chunk-size N] FILE...
+######################################################################
+@app.cli.command("products-import")
+@click.argument("files", nargs=-1, required=True, type=click.File("r", encoding="utf-8"))
+@click.option(
+    "--format",
+    "file_format",
+    type=click.Choice(["auto", "csv", "ndjson"]),
+    default="auto",
+    show_default=True,
+    help="File format, auto detects it from the file extension",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=5000,
+    show_default=True,
+    help="Number of products validated and loaded at a time",
+)
+def products_import(files, file_format, chunk_size):
+    """
+    Imports products from CSV or NDJSON files, such as the ones made by
+    /api/products/export. The files are read in streaming chunks, every
+    product is validated with the model rules, and invalid ones are skipped.
+    New ids are assigned to the imported products. Every chunk is committed
+    on its own, so when the database rejects one the import stops with the
+    line it started at, and can be resumed from there.
+    """
+    start = time.perf_counter()
+    imported = 0
+    rejected = []
+    products = validated_products(files, file_format, rejected)
+    for chunk in iter(lambda: list(itertools.islice(products, chunk_size)), []):
+        try:
+            Product.import_many([product for _, product in chunk])
+        except DataValidationError as error:
+            file_name, line = chunk[0][0]
+            raise click.ClickException(
+                f"Import stopped at the chunk that starts at {file_name}:{line}: {error}\n"
+                f"Imported {imported} products before it, resume the import from that line"
+            ) from error
+        imported += len(chunk)
+        elapsed = time.perf_counter() - start
+        click.echo(f"Imported {imported} products ({imported / elapsed:.0f} rows/sec)")
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Imported {imported} products and rejected {len(rejected)} in {elapsed:.2f}s "
+        f"({imported / elapsed:.0f} rows/sec)"
+    )
+
+
+def validated_products(files, file_format, rejected):
+    """Yields the file name and line of every valid record with its Product, and collects the invalid ones"""
+    for file in files:
+        for line, record in read_records(file, file_format):
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                product = Product().deserialize(record)
+                product.likes = record.get("likes", 0)
+            except (DataValidationError, ValueError) as error:
+                rejected.append((file.name, line))
+                click.echo(f"{file.name}:{line}: {error}", err=True)
+                continue
+            yield (file.name, line), product
+
+
+def read_records(file, file_format):
+    """
+    Yields the line number and record of every product in a file. CSV records
+    are dictionaries, NDJSON records are the JSON text of the line.
+    """
+    if file_format == "csv" or (file_format == "auto" and file.name.lower().endswith(".csv")):
+        reader = csv.DictReader(file)
+        for record in reader:
+            # optional values are empty in CSV, and numbers are text that
+            # is left alone when it does not parse so the model rejects it
+            record = {key: value for key, value in record.items() if value != ""}
+            for key, kind in (("price", float), ("rating", float), ("likes", int)):
+                if key in record and record[key].lstrip("-").replace(".", "", 1).isdigit():
+                    record[key] = kind(float(record[key]))
+            yield reader.line_num, record
+    else:
+        for line, text in enumerate(file, start=1):
+            if text.strip():
+                yield line, text
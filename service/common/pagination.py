@@ -0,0 +1,42 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Pagination Cursors
+
+This module contains utility functions to encode and decode the opaque
+cursors that are handed out to clients for keyset pagination
+"""
+import base64
+import binascii
+import json
+from service.models.models import DataValidationError
+
+
+def encode_cursor(sort: str, keyset: list) -> str:
+    """Encodes a sort order and the keyset of the last row into an opaque cursor"""
+    payload = json.dumps({"sort": sort, "after": keyset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decodes an opaque cursor back into its sort order and keyset"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(data["sort"]), list(data["after"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as error:
+        raise DataValidationError(f"Invalid cursor: {cursor}") from error
@@ -0,0 +1,181 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Connection Pool
+
+This module sizes the SQLAlchemy connection pool of every worker from the
+settings of the app, and collects metrics of the pool: how long checkouts
+wait for a connection, and how many connections are in use and in overflow.
+"""
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+def worker_budget(config):
+    """Returns the connections that one worker may open, or None when they are not capped"""
+    if not config["DB_MAX_CONNECTIONS"]:
+        return None
+    return max(config["DB_MAX_CONNECTIONS"] // config["WEB_CONCURRENCY"], 1)
+
+
+def asgi_budgets(config) -> tuple:
+    """
+    Returns the connections of a worker that its sync and its async pool may
+    open when it serves the ASGI app, or None for both when they are not capped
+
+    The budget of the worker is split in proportion to the sizes of the two
+    pools, so together they stay within DB_MAX_CONNECTIONS.
+    """
+    budget = worker_budget(config)
+    if budget is None:
+        return None, None
+    sync_size = config["DB_POOL_SIZE"] or config["GUNICORN_THREADS"]
+    sync_budget = max(budget * sync_size // (sync_size + config["ASGI_DB_POOL_SIZE"]), 1)
+    return sync_budget, max(budget - sync_budget, 1)
+
+
+def engine_options(config, pool_size=None, budget=None) -> dict:
+    """
+    Returns the SQLAlchemy engine options of the connection pool
+
+    Every thread of a worker holds at most one connection at a time, so the
+    pool keeps DB_POOL_SIZE connections, the number of threads by default,
+    plus up to DB_MAX_OVERFLOW extra ones under bursts. When DB_MAX_CONNECTIONS
+    is set, it is the budget of a whole pod and is split between its
+    WEB_CONCURRENCY workers, or a worker that keeps two pools passes the
+    budget of each. SQLite keeps the pool Flask-SQLAlchemy picks.
+    """
+    if config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        return {}
+    pool_size = pool_size or config["DB_POOL_SIZE"] or config["GUNICORN_THREADS"]
+    max_overflow = config["DB_MAX_OVERFLOW"]
+    budget = budget or worker_budget(config)
+    if budget:
+        pool_size = min(pool_size, budget)
+        max_overflow = min(max_overflow, budget - pool_size)
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": max(pool_size, 1),
+        "max_overflow": max_overflow,
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+    }
+
+
+class PoolMetrics:
+    """
+    Counters of the connection pool of an engine
+
+    Checkouts, new connections and invalidations are counted through the
+    pool events. The wait for a connection is timed by InstrumentedQueuePool,
+    since no event fires before a checkout starts waiting.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+        self._lock = threading.Lock()
+
+    def listen(self, engine):
+        """Collects the metrics of the pool of an engine"""
+        self.engine = engine
+        event.listen(engine, "checkout", self.on_checkout)
+        event.listen(engine, "connect", self.on_connect)
+        event.listen(engine, "invalidate", self.on_invalidate)
+        if isinstance(engine.pool, InstrumentedQueuePool):
+            engine.pool.metrics = self
+
+    def on_checkout(self, *_):
+        """Counts a checkout and the peak number of connections in use"""
+        with self._lock:
+            self.checkouts += 1
+            if isinstance(self.engine.pool, QueuePool):
+                self.peak_in_use = max(self.peak_in_use, self.engine.pool.checkedout())
+
+    def on_connect(self, *_):
+        """Counts a new database connection"""
+        with self._lock:
+            self.connects += 1
+
+    def on_invalidate(self, *_):
+        """Counts a connection that was invalidated, such as by a failed pre-ping"""
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        """Records how long a checkout waited for a connection"""
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def stats(self) -> dict:
+        """Returns the counters along with the current state of the pool"""
+        with self._lock:
+            stats = {
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+                "peak_in_use": self.peak_in_use,
+            }
+        pool = self.engine.pool if self.engine is not None else None
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                in_use=pool.checkedout(),
+                idle=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that times how long every checkout waits for a connection"""
+
+    metrics = None
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start, timed_out)
@@ -0,0 +1,164 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Read Replicas
+
+This module routes the reads of read-only endpoints to the read replicas of
+the database, round-robin over the replicas that pass a health check, while
+everything else goes to the primary. A client that has to read its own
+writes pins its reads to the primary with an X-Read-From: primary header, and
+every successful write sets a short-lived cookie that does the same. Pinned
+reads skip the caches, with or without replicas, since the write may have
+been handled by another worker. Reads from a replica never fill the caches.
+"""
+import itertools
+import logging
+import math
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from flask import request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import exc, text
+from service.common.cache import cache_lookups, cache_stores
+
+logger = logging.getLogger("flask.app")
+
+# Name of the header and of the cookie that pin reads to the primary
+READ_FROM_HEADER = "X-Read-From"
+READ_FROM_COOKIE = "read_from"
+PRIMARY = "primary"
+
+# The replica engine that the reads of the current request go to, if any
+replica_engine = ContextVar("replica_engine", default=None)
+
+
+class RoutingSession(Session):
+    """A session that sends the reads of read-only requests to their replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = replica_engine.get()
+        if bind is None and engine is not None and not self._flushing:
+            return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Picks the replica that the reads of a read-only request go to
+
+    The router has no replicas until init_app() is given their engines, and
+    then reads fall back to the primary when every replica is down. The
+    health of a replica is checked with SELECT 1 at most once every
+    REPLICA_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self.engines = []
+        self.check_interval = 5.0
+        self.pin_seconds = 5
+        self.reads = {}
+        self._health = {}
+        self._cursor = itertools.count()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, engines):
+        """Routes reads to the replica engines and pins reads after writes"""
+        self.engines = list(engines)
+        self.check_interval = app.config.get("REPLICA_CHECK_INTERVAL", 5.0)
+        # the pin outlives both the replica lag and the entries that the
+        # caches of other workers loaded before the write
+        self.pin_seconds = max(app.config.get("READ_PRIMARY_SECONDS", 5), math.ceil(app.config.get("CACHE_TTL", 0)))
+        app.after_request(self.pin_after_write)
+
+    def choose(self):
+        """Returns the next healthy replica engine, or None when there is none"""
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._cursor) % len(self.engines)]
+            if self.is_healthy(engine):
+                with self._lock:
+                    self.reads[engine] = self.reads.get(engine, 0) + 1
+                return engine
+        return None
+
+    def is_healthy(self, engine) -> bool:
+        """Returns whether a replica answered its last health check"""
+        checked, healthy = self._health.get(engine, (None, True))
+        now = time.monotonic()
+        if checked is not None and now - checked < self.check_interval:
+            return healthy
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            healthy = True
+        except exc.DBAPIError as error:
+            logger.warning("Replica %s failed its health check: %s", engine.url.host or engine.url.database, error)
+            healthy = False
+        with self._lock:
+            self._health[engine] = (now, healthy)
+        return healthy
+
+    def read_only(self, function):
+        """Routes the reads of a view to a replica unless the request pins them to the primary"""
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            tokens = []
+            if is_pinned():
+                # the caches of this process may hold rows read before the
+                # client's last write, which another worker may have handled
+                tokens.append((cache_lookups, cache_lookups.set(False)))
+            elif self.engines:
+                engine = self.choose()
+                tokens.append((replica_engine, replica_engine.set(engine)))
+                if engine is not None:
+                    # rows read from a lagging replica must not outlive the read
+                    tokens.append((cache_stores, cache_stores.set(False)))
+            try:
+                return function(*args, **kwargs)
+            finally:
+                for variable, token in reversed(tokens):
+                    variable.reset(token)
+
+        return wrapper
+
+    def pin_after_write(self, response):
+        """Pins the next reads of a client to the primary after it writes"""
+        if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            response.set_cookie(READ_FROM_COOKIE, PRIMARY, max_age=self.pin_seconds, httponly=True, samesite="Lax")
+        return response
+
+    def stats(self) -> list:
+        """Returns the health and the number of reads of every replica"""
+        return [
+            {
+                "host": engine.url.host or engine.url.database,
+                "healthy": self._health.get(engine, (None, True))[1],
+                "reads": self.reads.get(engine, 0),
+            }
+            for engine in self.engines
+        ]
+
+
+def is_pinned(current=None) -> bool:
+    """Returns whether a request, the current Flask request by default, has to read from the primary"""
+    current = current or request
+    return (
+        current.headers.get(READ_FROM_HEADER, "").lower() == PRIMARY
+        or current.cookies.get(READ_FROM_COOKIE) == PRIMARY
+    )
@@ -0,0 +1,80 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Startup
+
+This module times the phases of building the app and waits for the
+database to accept connections, with exponential backoff, before the app
+starts serving, so a worker that boots while the database restarts does not
+exit and get respawned in a loop.
+"""
+import time
+from contextlib import contextmanager
+from retry.api import retry_call
+from sqlalchemy import exc, text
+
+
+class StartupTimer:
+    """Measures how long every phase of the startup takes"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the block of a phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def total(self) -> float:
+        """Returns the seconds since the startup began"""
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        """Returns the total time and the time of every phase in milliseconds"""
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        return f"Startup took {self.total() * 1000:.0f} ms ({phases})"
+
+
+def ping(engine):
+    """Opens a connection to a database and runs SELECT 1"""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def wait_for_database(engine, config, logger):
+    """
+    Waits until a database accepts connections
+
+    The connection is tried RETRY_COUNT times, first after RETRY_DELAY
+    seconds and then waiting RETRY_BACKOFF times longer each time, at most
+    RETRY_MAX_DELAY seconds. The last error is raised when every try fails.
+    """
+    retry_call(
+        ping,
+        fargs=[engine],
+        exceptions=exc.OperationalError,
+        tries=max(config["RETRY_COUNT"], 1),
+        delay=config["RETRY_DELAY"],
+        backoff=config["RETRY_BACKOFF"],
+        max_delay=config["RETRY_MAX_DELAY"],
+        logger=logger,
+    )
@@ -20,17 +20,71 @@ price (float, required) - the price of the product, in dollars (e.g. 9.99)
 rating (float, required, default=0.0) - the rating of the product (e.g. 4.5)
 category (string) - the category of the product (e.g. "clothes")
 status (enum, required, default="active") - the status of the product (i.e. "active" or "disabled")
+likes (integer) - the number of likes of the product
+version (integer) - the version of the product, incremented by every change
 """
 
 import logging
+import random
+import re
+from collections import Counter
+from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from urllib.parse import unquote_plus, urlencode
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (
+    DDL,
+    Column,
+    Double,
+    Integer,
+    MetaData,
+    Table,
+    Text,
+    bindparam,
+    cast,
+    collate,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    literal,
+    literal_column,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import set_committed_value
+from service.common.cache import Cache
+from service.common.pool import PoolMetrics
+from service.common.replicas import ReplicaRouter, RoutingSession
 
 logger = logging.getLogger("flask.app")
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+
+def escape_like(value: str) -> str:
+    """Escapes the wildcards of a LIKE pattern with backslashes"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# Create the SQLAlchemy object to be initialized later in init_db(), with
+# sessions that send the reads of read-only requests to a replica
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Create the router of reads to the read replicas, if there are any
+replicas = ReplicaRouter()
+
+# Create the read-through cache of serialized Products to be initialized later
+cache = Cache("products")
+
+# Create the cache of query results over many Products, which every write clears
+query_cache = Cache("queries")
+
+# Create the metrics of the connection pool of the database engine
+pool_metrics = PoolMetrics()
 
 
 class DataValidationError(Exception):
@@ -44,6 +98,106 @@ class Status(Enum):
     DISABLED = 1
 
 
+@dataclass(frozen=True)
+class Range:
+    """A range of numbers parsed from a query parameter such as "2-4", "2-", "-4" or "4" """
+
+    low: float = None
+    high: float = None
+
+    @classmethod
+    def parse(cls, key: str, value: str):
+        """Parses a range query parameter"""
+        low, dash, high = value.partition("-")
+        try:
+            low = float(low) if low else None
+            high = float(high) if high else None
+        except ValueError as error:
+            raise DataValidationError(f"Invalid range for {key}: {value}") from error
+        if not dash:
+            high = low
+        if (low is None and high is None) or (low is not None and high is not None and low > high):
+            raise DataValidationError(f"Invalid range for {key}: {value}")
+        return cls(low, high)
+
+    def clause(self, column):
+        """Returns the SQL expression that matches this range on a column"""
+        if self.low == self.high:
+            return column == self.low
+        if self.low is None:
+            return column <= self.high
+        if self.high is None:
+            return column >= self.low
+        return column.between(self.low, self.high)
+
+
+@dataclass(frozen=True)
+class ProductFilter:
+    """
+    A parsed set of query parameters that Products can be filtered by
+
+    Filters are parsed once per distinct query and cached, and all of them
+    are combined into the WHERE clause of a single SQL query
+    """
+
+    name: str = None
+    category: str = None
+    status: Status = None
+    price: Range = None
+    rating: Range = None
+    likes: Range = None
+
+    FIELDS = ("name", "category", "status", "price", "rating", "likes")
+
+    @classmethod
+    def from_query(cls, **query):
+        """Returns the filter for query parameters, skipping the ones that are not set"""
+        unknown = set(query) - set(cls.FIELDS)
+        if unknown:
+            raise DataValidationError(f"Invalid query parameters: {', '.join(sorted(unknown))}")
+        return cls.parse(cls.normalize(query))
+
+    @staticmethod
+    def normalize(query: dict) -> str:
+        """Normalizes query parameters into a canonical query string"""
+        return urlencode(
+            sorted((key, str(value).strip()) for key, value in query.items() if value not in (None, ""))
+        )
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def parse(cls, query_string: str):
+        """Parses a normalized query string into a filter"""
+        fields = {}
+        for key, value in (item.split("=", 1) for item in query_string.split("&") if item):
+            value = unquote_plus(value)
+            if key in ("name", "category"):
+                fields[key] = value
+            elif key == "status":
+                try:
+                    fields[key] = Status[value.upper()]
+                except KeyError as error:
+                    raise DataValidationError(f"Invalid status: {value}") from error
+            else:
+                fields[key] = Range.parse(key, value)
+        return cls(**fields)
+
+    def clauses(self) -> list:
+        """Returns the SQL expressions that all have to match for a Product to pass the filter"""
+        clauses = []
+        for key in ("name", "category"):
+            value = getattr(self, key)
+            if value is not None:
+                clauses.append(getattr(Product, key).ilike(f"%{escape_like(value)}%", escape="\\"))
+        if self.status is not None:
+            clauses.append(Product.status == self.status)
+        for key in ("price", "rating", "likes"):
+            value = getattr(self, key)
+            if value is not None:
+                clauses.append(value.clause(getattr(Product, key)))
+        return clauses
+
+
 class Product(db.Model):
     # pylint: disable=too-many-instance-attributes
     """
@@ -64,6 +218,48 @@ class Product(db.Model):
         db.Enum(Status), nullable=False, server_default=(Status.ACTIVE.name)
     )
     likes = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, server_default="1")
+
+    # The ORM increments the version on every update, and statements that
+    # update products directly must do the same
+    __mapper_args__ = {"version_id_col": version}
+
+    ##################################################
+    # Indexes
+    ##################################################
+    # B-tree indexes on (column, id) serve both range filters and keyset
+    # pagination on that column. Category substring matches use a trigram
+    # GIN index on PostgreSQL; SQLite has no index for a LIKE '%x%' and scans
+    # the table. Name prefix matches of suggestions use a lower(name)
+    # text_pattern_ops index on PostgreSQL, and a case-insensitive index on
+    # SQLite.
+    __table_args__ = (
+        db.Index("ix_product_price_id", price, id),
+        db.Index("ix_product_rating_id", rating, id),
+        db.Index("ix_product_likes_id", likes, id),
+        db.Index(
+            "ix_product_category_trgm",
+            category,
+            postgresql_using="gin",
+            postgresql_ops={"category": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        db.Index(
+            "ix_product_name_prefix",
+            func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ).ddl_if(dialect="postgresql"),
+        db.Index("ix_product_name_nocase", collate(name, "NOCASE")).ddl_if(dialect="sqlite"),
+    )
+
+    # Columns that can be changed by a partial update
+    UPDATABLE = ("name", "img_url", "description", "price", "rating", "category", "status")
+
+    # Columns that listings can be sorted and paginated by, with their types
+    # (rank is the relevance of a full-text search and only exists in searches)
+    SORT_KEYS = {"id": int, "name": str, "price": float, "rating": float, "likes": int, "rank": float}
+
+    # The sort keys and the version; enough to paginate and compute an ETag
+    KEY_COLUMNS = (id, name, price, rating, likes, version)
 
     def __repr__(self):
         return f"<Product {self.name} id=[{self.id}]>"
@@ -81,6 +277,75 @@ class Product(db.Model):
             db.session.rollback()
             logger.error("Error creating record: %s", self)
             raise DataValidationError(e) from e
+        finally:
+            query_cache.clear()
+
+    @classmethod
+    def create_many(cls, products):
+        """
+        Creates Products to the database in a single transaction
+
+        The rows are sent as multi-row INSERT ... RETURNING id statements
+        instead of one INSERT and one commit per Product.
+        """
+        logger.info("Creating %d products", len(products))
+        rows = [
+            {
+                column.key: getattr(product, column.key)
+                for column in cls.__table__.columns
+                if column.key not in ("id", "likes", "version")
+            }
+            | {"likes": product.likes or 0, "version": 1}
+            for product in products
+        ]
+        try:
+            ids = db.session.scalars(
+                insert(cls).returning(cls.id, sort_by_parameter_order=True), rows
+            ).all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error creating %d records", len(products))
+            raise DataValidationError(e) from e
+        finally:
+            query_cache.clear()
+        for product, row, product_id in zip(products, rows, ids):
+            product.id = product_id
+            product.likes = row["likes"]
+            product.version = row["version"]
+
+    @classmethod
+    def import_many(cls, products):
+        """
+        Loads validated Products into the database as fast as possible
+
+        PostgreSQL gets the rows through COPY ... FROM STDIN, other databases
+        through a single executemany INSERT. No ids are returned.
+        """
+        logger.info("Importing %d products", len(products))
+        columns = [column.key for column in cls.__table__.columns if column.key not in ("id", "version")]
+        rows = [
+            {key: getattr(product, key) for key in columns} | {"likes": product.likes or 0}
+            for product in products
+        ]
+        try:
+            connection = db.session.connection()
+            if connection.dialect.name == "postgresql":
+                copy_sql = f"COPY {cls.__tablename__} ({', '.join(columns)}) FROM STDIN"
+                with connection.connection.driver_connection.cursor() as cursor:
+                    with cursor.copy(copy_sql) as copy:
+                        for row in rows:
+                            row["status"] = row["status"].name
+                            copy.write_row([row[key] for key in columns])
+            else:
+                connection.execute(insert(cls.__table__), rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error importing %d records", len(products))
+            raise DataValidationError(e) from e
+        finally:
+            query_cache.clear()
 
     def update(self):
         """
@@ -93,10 +358,14 @@ class Product(db.Model):
             db.session.rollback()
             logger.error("Error updating record: %s", self)
             raise DataValidationError(e) from e
+        finally:
+            cache.invalidate(self.id)
+            query_cache.clear()
 
     def delete(self):
         """Removes a Product from the data store"""
         logger.info("Deleting %s", self.name)
+        product_id = self.id
         try:
             db.session.delete(self)
             db.session.commit()
@@ -104,19 +373,21 @@ class Product(db.Model):
             db.session.rollback()
             logger.error("Error deleting record: %s", self)
             raise DataValidationError(e) from e
+        finally:
+            cache.invalidate(product_id)
+            query_cache.clear()
 
     def like(self):
         """
         Increases the like count for a product
         """
         logger.info("Adding like to %s", self.name)
-        self.likes += 1
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            logger.error("Error adding like to product: %s", self)
-            raise DataValidationError(e) from e
+        likes = self.add_like(self.id)
+        if likes is None:
+            raise DataValidationError(f"Product with id '{self.id}' was not found.")
+        set_committed_value(self, "likes", likes)
+        if inspect(self).persistent:
+            db.session.expire(self, ["version"])
 
     def serialize(self):
         """Serializes a Product into a dictionary"""
@@ -130,6 +401,7 @@ class Product(db.Model):
             "category": self.category,
             "status": self.status.name,
             "likes": self.likes,
+            "version": self.version,
         }
 
     def deserialize(self, data):
@@ -171,10 +443,205 @@ class Product(db.Model):
             ) from error
         return self
 
+    @classmethod
+    def validate_changes(cls, data):
+        """
+        Validates a partial set of changes to a Product
+
+        Only the attributes that are present are validated, with the same
+        rules as a full Product. A null value clears an optional attribute.
+
+        Args:
+            data (dict): A dictionary containing the attributes to change
+
+        Returns:
+            a dictionary of the validated column values
+        """
+        if not isinstance(data, dict) or not data:
+            raise DataValidationError("Invalid changes: body of request must be a non-empty object")
+        unknown = set(data) - set(cls.UPDATABLE)
+        if unknown:
+            raise DataValidationError(f"Invalid changes: cannot change {', '.join(sorted(unknown))}")
+        product = cls()
+        for key, value in data.items():
+            if key in ("name", "img_url", "description", "category") and value is not None:
+                if not isinstance(value, str):
+                    raise DataValidationError(f"Invalid type for str [{key}]: {type(value)}")
+            elif key == "price" and isinstance(value, int):
+                value = float(value)
+            elif key == "status" and value is not None:
+                try:
+                    value = Status[str(value).upper()]
+                except KeyError as error:
+                    raise DataValidationError(f"Invalid status: {value}") from error
+            # the @validates rules run when the attribute is set
+            setattr(product, key, value)
+        return {key: getattr(product, key) for key in data}
+
     ##################################################
     # CLASS METHODS
     ##################################################
 
+    @classmethod
+    def add_like(cls, product_id, shards=0):
+        """
+        Increases the like count for a product with a single atomic UPDATE
+
+        The increment happens in the database, so concurrent likes are never
+        lost and the product does not have to be loaded first. With shards
+        greater than one, the like goes to a random slot of a sharded counter
+        instead, so likes of one hot product do not queue on its row lock.
+
+        Returns:
+            the new like count, or None if the product does not exist
+        """
+        logger.info("Adding like to product with id %s", product_id)
+        try:
+            if shards > 1:
+                likes = ProductLikeShard.add_like(product_id, random.randrange(shards))
+            else:
+                statement = (
+                    update(cls)
+                    .where(cls.id == product_id)
+                    .values(likes=cls.likes + 1, version=cls.version + 1)
+                    .returning(cls.likes)
+                    .execution_options(synchronize_session=False)
+                )
+                likes = db.session.execute(statement).scalar_one_or_none()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error adding like to product with id: %s", product_id)
+            raise DataValidationError(e) from e
+        finally:
+            cache.invalidate(product_id)
+            query_cache.clear()
+        return likes
+
+    @classmethod
+    def update_by_id(cls, product_id, changes, versions=None):
+        """
+        Applies validated changes to a Product with a single
+        UPDATE ... RETURNING statement, without loading it first
+
+        Args:
+            product_id (int): the id of the Product to update
+            changes (dict): the validated column values to set
+            versions (list): when given, the Product is only updated if its
+                current version is one of these
+
+        Returns:
+            the updated Product, or None if it does not exist or its version
+            did not match
+        """
+        logger.info("Updating product with id %s to %s", product_id, changes)
+        statement = update(cls).where(cls.id == product_id)
+        if versions is not None:
+            statement = statement.where(cls.version.in_(versions))
+        statement = (
+            statement.values(**changes, version=cls.version + 1)
+            .returning(cls)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        try:
+            product = db.session.scalars(statement).one_or_none()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error updating product with id: %s", product_id)
+            raise DataValidationError(e) from e
+        finally:
+            cache.invalidate(product_id)
+            query_cache.clear()
+        return product
+
+    @classmethod
+    def update_by_query(cls, changes, **query):
+        """
+        Applies validated changes to all of the Products that match the query
+        parameters with a single UPDATE statement
+
+        Returns:
+            the number of Products that were updated
+        """
+        logger.info("Updating products matching %s with %s", query, changes)
+        statement = (
+            update(cls)
+            .where(*ProductFilter.from_query(**query).clauses())
+            .values(**changes, version=cls.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            count = db.session.execute(statement).rowcount
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error updating products matching %s", query)
+            raise DataValidationError(e) from e
+        finally:
+            cache.clear()
+            query_cache.clear()
+        return count
+
+    @classmethod
+    def delete_by_query(cls, **query):
+        """
+        Deletes all of the Products that match the query parameters with a
+        single DELETE statement
+
+        Returns:
+            the number of Products that were deleted
+        """
+        logger.info("Deleting products matching %s", query)
+        statement = (
+            delete(cls)
+            .where(*ProductFilter.from_query(**query).clauses())
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            count = db.session.execute(statement).rowcount
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error deleting products matching %s", query)
+            raise DataValidationError(e) from e
+        finally:
+            cache.clear()
+            query_cache.clear()
+        return count
+
+    @classmethod
+    def add_missing_columns(cls, engine=None):
+        """Adds any of the declared columns that are missing from an existing table"""
+        engine = engine or db.engine
+        existing = {column["name"] for column in inspect(engine).get_columns(cls.__tablename__)}
+        with engine.begin() as connection:
+            for column in cls.__table__.columns:
+                if column.name in existing:
+                    continue
+                logger.info("Adding column %s to %s", column.name, cls.__tablename__)
+                ddl = f"ALTER TABLE {cls.__tablename__} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.execute(DDL(ddl))
+
+    @classmethod
+    def create_indexes(cls, engine=None):
+        """
+        Creates any of the declared indexes and the full-text search index
+        that are missing from an existing table
+        """
+        logger.info("Creating missing indexes on %s", cls.__tablename__)
+        with (engine or db.engine).begin() as connection:
+            if connection.dialect.name == "postgresql":
+                connection.execute(PG_TRGM_EXTENSION)
+            for index in cls.__table__.indexes:
+                index.create(connection, checkfirst=True)
+            for statement in SEARCH_DDL.get(connection.dialect.name, []):
+                connection.execute(DDL(statement))
+
     @classmethod
     def all(cls):
         """Returns all of the Products in the database"""
@@ -187,33 +654,281 @@ class Product(db.Model):
         logger.info("Processing lookup for id %s ...", by_id)
         return cls.query.get(by_id)
 
+    @classmethod
+    def find_version(cls, by_id):
+        """Returns the version of a Product by it's ID without loading it, or None"""
+        logger.info("Processing version lookup for id %s ...", by_id)
+        return db.session.execute(select(cls.version).where(cls.id == by_id)).scalar_one_or_none()
+
+    @classmethod
+    def find_row(cls, by_id):
+        """Finds a Product by it's ID and returns it as a read-only row, or None"""
+        logger.info("Processing row lookup for id %s ...", by_id)
+        return db.session.execute(cls.select_by().where(cls.id == by_id)).first()
+
+    @classmethod
+    def find_serialized(cls, by_id, serializer):
+        """
+        Finds a Product by it's ID and returns it serialized
+
+        Lookups are served from the read-through cache, which is invalidated
+        by update(), delete() and like() of this process and expires after
+        CACHE_TTL seconds for changes made by other processes
+
+        Args:
+            by_id (int): the id of the Product
+            serializer: a function that converts a Product row into a dictionary
+        """
+
+        def load():
+            row = cls.find_row(by_id)
+            return serializer(row) if row else None
+
+        return cache.get_or_load(by_id, load)
+
+    @classmethod
+    def find_serialized_many(cls, ids, serializer):
+        """
+        Finds Products by their IDs and returns them serialized by id
+
+        The Products that are in the read-through cache are served from it,
+        and all of the others are loaded with a single WHERE id IN query.
+        Ids that do not exist are left out.
+
+        Args:
+            ids (list): the ids of the Products
+            serializer: a function that converts a Product row into a dictionary
+        """
+
+        def load(missing):
+            logger.info("Processing lookup for ids %s ...", missing)
+            rows = db.session.execute(cls.select_by().where(cls.id.in_(missing))).all()
+            return {row.id: serializer(row) for row in rows}
+
+        return cache.get_many_or_load(ids, load)
+
     @classmethod
     def filter_by_query(cls, **query):
         """Find all products that match the given query parameters"""
+        return cls.query_by(**query).all()
+
+    @classmethod
+    def query_by(cls, **query):
+        """Returns a query for the products that match all of the given query parameters"""
         logger.info("Processing query: %s", query)
-        query_obj = cls.query
-        for key, value in query.items():
-            if key == "category":
-                query_obj = query_obj.filter(cls.category.ilike(f"%{value}%"))
-            elif key == "rating":
-                # Handle rating range queries
-                if "-" in value:
-                    min_rating, max_rating = map(float, value.split("-"))
-                    query_obj = query_obj.filter(
-                        cls.rating.between(min_rating, max_rating)
-                    )
-                else:
-                    query_obj = query_obj.filter(cls.rating == float(value))
-            elif key == "price":
-                # Handle price range queries
-                if "-" in value:
-                    min_price, max_price = map(float, value.split("-"))
-                    query_obj = query_obj.filter(
-                        cls.price.between(min_price, max_price)
-                    )
-                else:
-                    query_obj = query_obj.filter(cls.price == float(value))
-        return query_obj.all()
+        return cls.query.filter(*ProductFilter.from_query(**query).clauses())
+
+    @classmethod
+    def select_by(cls, **query):
+        """
+        Returns a Core select of the products that match all of the given
+        query parameters
+
+        The statement selects the table rather than the mapped class, so its
+        results are lightweight read-only rows with the column attributes
+        instead of Product instances in the session.
+        """
+        logger.info("Processing query: %s", query)
+        return select(cls.__table__).where(*ProductFilter.from_query(**query).clauses())
+
+    @classmethod
+    def search(cls, statement, text):
+        """
+        Narrows a select of Products down to a full-text search of their
+        name and description, and adds the relevance of every row to it as
+        the rank column, higher is better
+
+        PostgreSQL matches the generated search_vector column with
+        websearch_to_tsquery() and ranks with ts_rank(); SQLite matches all
+        of the words through the FTS5 table and ranks with bm25().
+        """
+        logger.info("Processing search: %s", text)
+        words = re.findall(r"\w+", text or "")
+        if not words:
+            raise DataValidationError(f"Invalid search: {text!r} has no words")
+        if db.session.get_bind().dialect.name == "postgresql":
+            vector = literal_column(f"{cls.__tablename__}.search_vector")
+            query = func.websearch_to_tsquery("english", text)
+            # ts_rank() returns a real, which the cursor would round and then
+            # compare unequal to the rank of its own row, so widen it first
+            rank = cast(func.ts_rank(vector, query), Double).label("rank")
+            return statement.add_columns(rank).where(vector.op("@@")(query))
+        match = " ".join(f'"{word}"' for word in words)
+        return (
+            statement.join(PRODUCT_FTS, PRODUCT_FTS.c.rowid == cls.id)
+            .add_columns((-func.bm25(literal_column(PRODUCT_FTS.name))).label("rank"))
+            .where(PRODUCT_FTS.c.product_fts.match(match))
+        )
+
+    @classmethod
+    def suggest(cls, prefix, limit=10):
+        """
+        Returns the ids and names of the most liked Products whose name
+        starts with a prefix, ignoring case
+
+        The prefix match is served by the name prefix index, and the results
+        are kept in the query cache until the next write.
+        """
+        key = ("suggest", prefix.lower(), limit)
+
+        def load():
+            logger.info("Processing suggestions for prefix %r", prefix)
+            pattern = f"{escape_like(prefix.lower())}%"
+            if db.session.get_bind().dialect.name == "postgresql":
+                match = func.lower(cls.name).like(pattern, escape="\\")
+            else:
+                match = cls.name.like(pattern, escape="\\")
+            statement = select(cls.id, cls.name).where(match).order_by(cls.likes.desc(), cls.id).limit(limit)
+            return [{"id": row.id, "name": row.name} for row in db.session.execute(statement)]
+
+        return query_cache.get_or_load(key, load)
+
+    @classmethod
+    def facets(cls, price_bucket=50.0, rating_bucket=1.0, text=None, **query):
+        """
+        Returns the total count, the count per category and histograms of
+        the prices and ratings of the Products that match the query
+        parameters and the full-text search text, if there is one
+
+        All of it comes from a single query grouped by category, price bucket
+        and rating bucket that is rolled up in Python, and the results are
+        kept in the query cache until the next write.
+        """
+        key = ("facets", ProductFilter.normalize(query), text, price_bucket, rating_bucket)
+        clauses = ProductFilter.from_query(**query).clauses()
+
+        def load():
+            logger.info("Processing facets of query: %s, search: %s", query, text)
+            price = cls.bucket(cls.price, price_bucket).label("price_bucket")
+            rating = cls.bucket(cls.rating, rating_bucket).label("rating_bucket")
+            statement = (
+                select(cls.category, price, rating, func.count().label("count"))
+                .where(*clauses)
+                .group_by(cls.category, price, rating)
+            )
+            if text is not None:
+                matches = cls.search(select(cls.id), text).with_only_columns(cls.id)
+                statement = statement.where(cls.id.in_(matches))
+            return cls.roll_up_facets(db.session.execute(statement), price_bucket, rating_bucket)
+
+        return query_cache.get_or_load(key, load)
+
+    @staticmethod
+    def bucket(column, width):
+        """Returns the SQL expression for the number of the histogram bucket of a column"""
+        if db.session.get_bind().dialect.name == "postgresql":
+            return cast(func.floor(column / width), Integer)
+        # prices and ratings are never negative, so truncating is the same as floor(),
+        # which SQLite only has when it is built with its math functions
+        return cast(column / width, Integer)
+
+    @staticmethod
+    def roll_up_facets(rows, price_bucket, rating_bucket) -> dict:
+        """Rolls the counts of (category, price bucket, rating bucket) groups up into facets"""
+        categories, prices, ratings = Counter(), Counter(), Counter()
+        for row in rows:
+            categories[row.category] += row.count
+            prices[row.price_bucket] += row.count
+            ratings[row.rating_bucket] += row.count
+
+        def histogram(counts, width):
+            return [
+                {"min": bucket * width, "max": (bucket + 1) * width, "count": counts[bucket]}
+                for bucket in sorted(counts)
+            ]
+
+        return {
+            "total": sum(categories.values()),
+            "categories": [
+                {"value": category, "count": count}
+                for category, count in sorted(categories.items(), key=lambda item: (-item[1], item[0] or ""))
+            ],
+            "price": histogram(prices, price_bucket),
+            "rating": histogram(ratings, rating_bucket),
+        }
+
+    @classmethod
+    def columns_for(cls, fields):
+        """
+        Returns the columns to select for the given fields, always including
+        the sort keys and the version that pagination and ETags rely on
+        """
+        keys = set(fields).union(cls.SORT_KEYS, ["version"])
+        return [column for column in cls.__table__.columns if column.key in keys]
+
+    @classmethod
+    def stream_by_query(cls, batch_size=1000, **query):
+        """
+        Returns an iterator over the rows of all of the Products that match
+        the query parameters in id order
+
+        The rows are fetched in batches through a server-side cursor, so
+        memory stays flat no matter how many Products there are.
+        """
+        logger.info("Processing export of query: %s", query)
+        statement = cls.select_by(**query).order_by(cls.id).execution_options(yield_per=batch_size)
+        return db.session.execute(statement)
+
+    @classmethod
+    def paginate(cls, statement, sort="id", limit=20, after=None):
+        """
+        Returns one page of a query using keyset pagination on (sort key, id)
+
+        Every page is fetched with an indexed range scan that starts right
+        after the last row of the previous page, so deep pages cost the same
+        as the first one.
+
+        Args:
+            statement: the select statement to paginate, as made by select_by()
+            sort (str): the column to sort by, prefixed with "-" for descending order
+            limit (int): the maximum number of Products on the page, or None for all
+            after (list): the keyset of the last Product of the previous page
+
+        Returns:
+            a tuple of the rows on the page and the keyset to continue from,
+            which is None on the last page
+        """
+        statement, columns = cls.keyset_statement(statement, sort, limit, after)
+        return cls.keyset_page(db.session.execute(statement).all(), columns, limit)
+
+    @classmethod
+    def keyset_statement(cls, statement, sort="id", limit=20, after=None):
+        """
+        Returns the statement of a page as described by paginate(), which
+        fetches one extra row to tell whether there is a next page, along
+        with the columns of its keyset
+        """
+        key = sort.lstrip("-")
+        if key not in cls.SORT_KEYS or key not in statement.selected_columns:
+            raise DataValidationError(f"Invalid sort key: {sort}")
+        descending = sort.startswith("-")
+        selected = statement.selected_columns
+        columns = [selected.id] if key == "id" else [selected[key], selected.id]
+        if after is not None:
+            types = [cls.SORT_KEYS[column.key] for column in columns]
+            if len(after) != len(columns) or not all(
+                isinstance(value, (int, float) if kind is float else kind)
+                for value, kind in zip(after, types)
+            ):
+                raise DataValidationError(f"Invalid keyset for sort key {sort}: {after}")
+            keyset = tuple_(*columns)
+            statement = statement.where(
+                keyset < tuple_(*after) if descending else keyset > tuple_(*after)
+            )
+        statement = statement.order_by(
+            *[column.desc() if descending else column.asc() for column in columns]
+        )
+        if limit is not None:
+            statement = statement.limit(limit + 1)
+        return statement, columns
+
+    @staticmethod
+    def keyset_page(rows, columns, limit):
+        """Returns the rows of a page and the keyset to continue from, or None on the last page"""
+        if limit is None or len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, [getattr(rows[-1], column.key) for column in columns]
 
     ##################################################
     # DATA VALIDATIONS
@@ -255,7 +970,7 @@ class Product(db.Model):
             raise DataValidationError("Price must be a float or integer")
         if price < 0:
             raise DataValidationError("Price must be non-negative")
-        return price
+        return float(price)
 
     @validates("rating")
     def validate_rating(self, key, rating):
@@ -264,7 +979,7 @@ class Product(db.Model):
             raise DataValidationError("Rating must be a float or integer")
         if rating < 0.0 or rating > 9.9:
             raise DataValidationError("Rating must be between 0 and 5")
-        return rating
+        return float(rating)
 
     @validates("category")
     def validate_category(self, key, category):
@@ -290,3 +1005,143 @@ class Product(db.Model):
         if likes < 0:
             raise DataValidationError("Likes must be non-negative")
         return likes
+
+
+class ProductLikeShard(db.Model):
+    """
+    Class that represents one slot of a sharded like counter
+
+    Sharded likes are spread over several rows per Product and are moved
+    into Product.likes by a periodic roll-up
+    """
+
+    ##################################################
+    # Table Schema
+    ##################################################
+    product_id = db.Column(
+        db.Integer, db.ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ProductLikeShard product_id=[{self.product_id}] shard=[{self.shard}]>"
+
+    @classmethod
+    def add_like(cls, product_id, shard):
+        """
+        Adds a like to one slot of a product's counter, creating the slot if needed
+
+        Returns:
+            the like count of the product including the likes that are not
+            rolled up yet, or None if the product does not exist
+        """
+        dialect = postgresql if db.session.get_bind().dialect.name == "postgresql" else sqlite
+        statement = (
+            dialect.insert(cls)
+            .from_select(
+                ["product_id", "shard", "count"],
+                select(Product.id, literal(shard), literal(1)).where(Product.id == product_id),
+            )
+            .on_conflict_do_update(
+                index_elements=[cls.product_id, cls.shard],
+                set_={"count": cls.count + 1},
+            )
+            .returning(cls.count)
+        )
+        if db.session.execute(statement).scalar_one_or_none() is None:
+            return None
+        pending = select(func.coalesce(func.sum(cls.count), 0)).where(cls.product_id == product_id)
+        return db.session.execute(
+            select(Product.likes + pending.scalar_subquery()).where(Product.id == product_id)
+        ).scalar_one()
+
+    @classmethod
+    def rollup(cls):
+        """
+        Moves the likes of all counter slots into Product.likes
+
+        Every slot is decremented by exactly the count that was read, so
+        likes that arrive while the roll-up runs are kept for the next one.
+
+        Returns:
+            the number of likes that were rolled up
+        """
+        logger.info("Rolling up sharded like counters")
+        table = cls.__table__
+        try:
+            slots = db.session.execute(
+                select(table.c.product_id, table.c.shard, table.c.count).where(table.c.count > 0)
+            ).all()
+            if slots:
+                totals = {}
+                for slot in slots:
+                    totals[slot.product_id] = totals.get(slot.product_id, 0) + slot.count
+                db.session.execute(
+                    update(table)
+                    .where(table.c.product_id == bindparam("slot_product_id"), table.c.shard == bindparam("slot_shard"))
+                    .values(count=table.c.count - bindparam("taken")),
+                    [{"slot_product_id": p, "slot_shard": s, "taken": c} for p, s, c in slots],
+                )
+                products = Product.__table__
+                db.session.execute(
+                    update(products)
+                    .where(products.c.id == bindparam("product_id"))
+                    .values(likes=products.c.likes + bindparam("taken"), version=products.c.version + 1),
+                    [{"product_id": p, "taken": c} for p, c in totals.items()],
+                )
+                db.session.execute(delete(table).where(table.c.count == 0))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error rolling up sharded like counters")
+            raise DataValidationError(e) from e
+        for slot in slots:
+            cache.invalidate(slot.product_id)
+        query_cache.clear()
+        return sum(slot.count for slot in slots)
+
+
+# The trigram operator class must exist before the GIN index is created
+PG_TRGM_EXTENSION = DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+event.listen(Product.__table__, "before_create", PG_TRGM_EXTENSION.execute_if(dialect="postgresql"))
+
+# Full-text search of the name and description: a stored generated tsvector
+# column with a GIN index on PostgreSQL, and an external content FTS5 table
+# that triggers keep in sync on SQLite. The statements are idempotent, so
+# they run after the table is created and again on `flask db-upgrade`.
+SEARCH_DDL = {
+    "postgresql": [
+        "ALTER TABLE product ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_product_search ON product USING gin (search_vector)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+        "name, description, content='product', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS product_fts_insert AFTER INSERT ON product BEGIN "
+        "INSERT INTO product_fts (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS product_fts_delete AFTER DELETE ON product BEGIN "
+        "INSERT INTO product_fts (product_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS product_fts_update AFTER UPDATE OF name, description ON product BEGIN "
+        "INSERT INTO product_fts (product_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO product_fts (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+        "INSERT INTO product_fts (product_fts) VALUES ('rebuild')",
+    ],
+}
+for search_dialect, search_statements in SEARCH_DDL.items():
+    for search_statement in search_statements:
+        event.listen(Product.__table__, "after_create", DDL(search_statement).execute_if(dialect=search_dialect))
+event.listen(
+    Product.__table__, "before_drop", DDL("DROP TABLE IF EXISTS product_fts").execute_if(dialect="sqlite")
+)
+
+# The FTS5 table of the SQLite search, which is not part of the models' metadata
+PRODUCT_FTS = Table(
+    "product_fts",
+    MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("product_fts", Text),
+)
@@ -21,12 +21,25 @@ This service implements a REST API that allows you to Create, Read, Update
 and Delete Products
 """
 
+import csv
+import hashlib
+import io
+from functools import lru_cache
 from flask import current_app as app  # Import Flask application
+from flask import request, stream_with_context
+from werkzeug.http import quote_etag
 from flask_restx import Resource, fields, reqparse
-from service.models.models import Product, Status
+from service.models.models import (
+    DataValidationError, Product, ProductFilter, Status, cache, pool_metrics, query_cache, replicas
+)
 from service.common import status  # HTTP Status Codes
+from service.common.pagination import encode_cursor, decode_cursor
+from service.common.serializer import compile_serializer, dumps
 from .. import api
 
+# The versions of an If-Match: * header, which match any version of a Product that exists
+ANY_VERSION = object()
+
 
 ############################################################
 # Health Endpoint
@@ -37,6 +50,19 @@ def health():
     return {"status": "OK"}, status.HTTP_200_OK
 
 
+############################################################
+# Stats Endpoint
+############################################################
+@app.route("/stats")
+def stats():
+    """Runtime statistics of the service"""
+    return {
+        "cache": {cache.name: cache.stats(), query_cache.name: query_cache.stats()},
+        "pool": pool_metrics.stats(),
+        "replicas": replicas.stats(),
+    }, status.HTTP_200_OK
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -108,22 +134,152 @@ product_model = api.inherit(
             readOnly=True,
             description="The unique identifier of the product",
         ),
+        "version": fields.Integer(
+            readOnly=True,
+            description="The version of the product, incremented by every change",
+        ),
     },
 )
 
-product_args = reqparse.RequestParser()
-product_args.add_argument(
-    "rating", type=str, location="args", required=False, help="List Products by rating"
+
+@lru_cache(maxsize=128)
+def product_serializer(fields=None):
+    """Returns the serializer of a set of product_model fields, compiled once per set"""
+    return compile_serializer(product_model, Product.__table__, fields)
+
+
+# Serializes Products and result rows straight into the product_model documents
+serialize_product = product_serializer()
+
+filter_args = reqparse.RequestParser()
+filter_args.add_argument(
+    "name", type=str, location="args", required=False, help="List Products whose name contains this text"
 )
-product_args.add_argument(
+filter_args.add_argument(
+    "rating", type=str, location="args", required=False, help="List Products by rating (e.g. 4 or 2-4)"
+)
+filter_args.add_argument(
     "category",
     type=str,
     location="args",
     required=False,
     help="List Product by category",
 )
+filter_args.add_argument(
+    "price", type=str, location="args", required=False, help="List Products by price (e.g. 9.99, 10-50 or 100-)"
+)
+filter_args.add_argument(
+    "likes", type=str, location="args", required=False, help="List Products by likes (e.g. 10- or 0-5)"
+)
+filter_args.add_argument(
+    "status",
+    type=str,
+    location="args",
+    required=False,
+    help="List Products by status (active or disabled)",
+)
+
+fields_args = reqparse.RequestParser()
+fields_args.add_argument(
+    "fields",
+    type=str,
+    location="args",
+    required=False,
+    help="Comma separated Product fields to return (e.g. id,name,price); all of them by default",
+)
+
+product_args = filter_args.copy()
+product_args.add_argument(fields_args.args[0])
+product_args.add_argument(
+    "ids",
+    type=str,
+    location="args",
+    required=False,
+    help="Comma separated ids of the Products to get in one request, in order; "
+    "cannot be combined with filters, search or pagination",
+)
 product_args.add_argument(
-    "price", type=str, location="args", required=False, help="List Products by price"
+    "q",
+    type=str,
+    location="args",
+    required=False,
+    help="Full-text search of the name and description; results are sorted by relevance (-rank) by default",
+)
+product_args.add_argument(
+    "sort",
+    type=str,
+    location="args",
+    required=False,
+    help="Sort Products by id, name, price, rating, likes or, in searches, rank (prefix with - for descending)",
+)
+product_args.add_argument(
+    "limit", type=int, location="args", required=False, help="Maximum number of Products per page"
+)
+product_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="Opaque cursor of the next page, as returned in the X-Next-Cursor header",
+)
+
+suggestion_model = api.model(
+    "ProductSuggestion",
+    {
+        "id": fields.Integer(description="The unique identifier of the product"),
+        "name": fields.String(description="The name of the product"),
+    },
+)
+
+suggest_args = reqparse.RequestParser()
+suggest_args.add_argument(
+    "prefix", type=str, location="args", required=True, help="The start of the Product names to suggest"
+)
+suggest_args.add_argument(
+    "limit", type=int, location="args", required=False, help="Maximum number of suggestions"
+)
+
+facet_count_model = api.model(
+    "FacetCount",
+    {
+        "value": fields.String(description="The category"),
+        "count": fields.Integer(description="The number of products in the category"),
+    },
+)
+
+bucket_model = api.model(
+    "HistogramBucket",
+    {
+        "min": fields.Float(description="The lower bound of the bucket, inclusive"),
+        "max": fields.Float(description="The upper bound of the bucket, exclusive"),
+        "count": fields.Integer(description="The number of products in the bucket"),
+    },
+)
+
+facets_model = api.model(
+    "ProductFacets",
+    {
+        "total": fields.Integer(description="The number of products that match"),
+        "categories": fields.List(fields.Nested(facet_count_model), description="Counts per category"),
+        "price": fields.List(fields.Nested(bucket_model), description="Histogram of the prices"),
+        "rating": fields.List(fields.Nested(bucket_model), description="Histogram of the ratings"),
+    },
+)
+
+facet_args = filter_args.copy()
+facet_args.add_argument(
+    "q", type=str, location="args", required=False, help="Full-text search of the name and description"
+)
+
+export_args = filter_args.copy()
+export_args.add_argument(
+    "format",
+    type=str,
+    location="args",
+    required=False,
+    default="ndjson",
+    choices=("ndjson", "csv"),
+    help="Export format: ndjson (one JSON Product per line) or csv",
 )
 
 ######################################################################
@@ -143,6 +299,7 @@ class ProductResource(Resource):
     Allows the manipulation of a single Product
     GET /products/{id} - Returns a Product with the id
     PUT /products/{id} - Update a Product with the id
+    PATCH /products/{id} - Update some attributes of a Product with the id
     DELETE /products/{id} -  Deletes a Product with the id
     """
 
@@ -150,22 +307,37 @@ class ProductResource(Resource):
     # RETRIEVE A PRODUCT
     # ------------------------------------------------------------------
     @api.doc("get_products")
+    @api.expect(fields_args, validate=True)
+    @api.response(304, "Product not modified")
     @api.response(404, "Product not found")
-    @api.marshal_with(product_model)
+    @api.response(200, "Success", product_model)
+    @replicas.read_only
     def get(self, product_id):
         """
         Retrieve a single Product
 
-        This endpoint will return a Product based on it's id
+        This endpoint will return a Product based on it's id. The ETag is the
+        version of the Product, so If-None-Match is answered with a 304 from
+        a lookup of the version alone. With fields, only those fields of the
+        cached Product are returned.
         """
         app.logger.info("Request for product with id: %s", product_id)
-        product = Product.find(product_id)
+        fields = get_fields(fields_args.parse_args())
+        if request.if_none_match:
+            version = Product.find_version(product_id)
+            if version is not None and request.if_none_match.contains_weak(str(version)):
+                app.logger.info("Product with id %s not modified", product_id)
+                return not_modified(quote_etag(str(version)))
+        product = Product.find_serialized(product_id, serialize_product)
         if not product:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Product with id '{product_id}' was not found.",
             )
-        return product.serialize(), status.HTTP_200_OK
+        headers = {"ETag": quote_etag(str(product["version"]))}
+        if fields:
+            product = {name: product[name] for name in fields}
+        return json_response(product, status.HTTP_200_OK, headers)
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING PRODUCT
@@ -173,27 +345,45 @@ class ProductResource(Resource):
     @api.doc("update_products")
     @api.response(404, "Product not found")
     @api.response(400, "The posted Product data was not valid")
+    @api.response(412, "The Product does not exist or was changed since the version in If-Match")
     @api.expect(product_model)
-    @api.marshal_with(product_model)
+    @api.response(200, "Success", product_model)
     def put(self, product_id):
         """
         Update a Product
 
-        This endpoint will update a Product based the body that is posted
+        This endpoint will update a Product based the body that is posted.
+        With an If-Match header, the Product is only updated if its version
+        still matches the ETag, so concurrent editors do not overwrite each
+        other.
         """
         app.logger.info("Request to update product with id: %s", product_id)
-        product = Product.find(product_id)
-        if not product:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Product with id '{product_id}' was not found.",
-            )
         app.logger.debug("Payload = %s", api.payload)
-        data = api.payload
-        product.deserialize(data)
-        product.id = product_id
-        product.update()
-        return product.serialize(), status.HTTP_200_OK
+        data = Product().deserialize(api.payload)
+        changes = {key: getattr(data, key) for key in Product.UPDATABLE}
+        return update_product(product_id, changes)
+
+    # ------------------------------------------------------------------
+    # UPDATE SOME ATTRIBUTES OF AN EXISTING PRODUCT
+    # ------------------------------------------------------------------
+    @api.doc("patch_products")
+    @api.response(404, "Product not found")
+    @api.response(400, "The posted changes were not valid")
+    @api.response(412, "The Product does not exist or was changed since the version in If-Match")
+    @api.expect(create_model)
+    @api.response(200, "Success", product_model)
+    def patch(self, product_id):
+        """
+        Update some attributes of a Product
+
+        This endpoint applies a JSON Merge Patch to a Product. Only the
+        attributes in the body are validated and written, and a null value
+        clears an optional attribute.
+        """
+        app.logger.info("Request to patch product with id: %s", product_id)
+        app.logger.debug("Payload = %s", api.payload)
+        changes = Product.validate_changes(api.payload)
+        return update_product(product_id, changes)
 
     # ------------------------------------------------------------------
     # DELETE A PRODUCT
@@ -225,29 +415,50 @@ class ProductCollection(Resource):
     # LIST ALL PRODUCTS
     # ------------------------------------------------------------------
     @api.doc("list_products")
+    @api.response(304, "Products not modified")
     @api.expect(product_args, validate=True)
-    @api.marshal_list_with(product_model)
+    @api.response(200, "Success", [product_model])
+    @replicas.read_only
     def get(self):
-        """Returns all Products"""
+        """
+        Returns a page of Products
+
+        Without a limit the page holds PAGE_SIZE_DEFAULT Products, and the
+        X-Next-Cursor and Link headers point to the next page. The weak ETag
+        is derived from the ids and versions of the listed Products, so
+        If-None-Match is answered with a 304 from a query of the key columns
+        alone. With fields, only the columns of those fields are selected.
+        With ids, the Products with those ids are returned in the requested
+        order and the ids that were not found are listed in the X-Missing-Ids
+        header. With q, the Products are searched by their name and
+        description and sorted by relevance.
+        """
         app.logger.info("Request to list Products")
-        products = []
         args = product_args.parse_args()
-        if args["category"]:
-            print(args["category"])
-            app.logger.info("Filtering by category: %s", args["category"])
-            products = Product.filter_by_query(category=args["category"])
-        elif args["price"]:
-            app.logger.info("Filtering by price: %s", args["price"])
-            products = Product.filter_by_query(price=args["price"])
-        elif args["rating"]:
-            app.logger.info("Filtering by rating: %s", args["rating"])
-            products = Product.filter_by_query(rating=args["rating"])
+        fields = get_fields(args)
+        if args["ids"] is not None:
+            return get_products_by_ids(args, fields)
+        filters = get_filters(args)
+        if filters:
+            app.logger.info("Filtering by: %s", filters)
         else:
             app.logger.info("Returning unfiltered list")
-            products = Product.all()
-        results = [product.serialize() for product in products]
+        query = Product.select_by(**filters)
+
+        if request.if_none_match:
+            versions, headers = list_products(query.with_only_columns(*Product.KEY_COLUMNS), args)
+            etag = collection_etag(versions, headers)
+            if request.if_none_match.contains_weak(etag):
+                app.logger.info("Products not modified")
+                return not_modified(quote_etag(etag, weak=True))
+        if fields:
+            query = query.with_only_columns(*Product.columns_for(fields))
+        products, headers = list_products(query, args)
+        headers["ETag"] = quote_etag(collection_etag(products, headers), weak=True)
+        serializer = product_serializer(fields)
+        results = [serializer(product) for product in products]
         app.logger.info("Returning %d products", len(results))
-        return results, status.HTTP_200_OK
+        return json_response(results, status.HTTP_200_OK, headers)
 
     # ------------------------------------------------------------------
     # ADD A NEW PRODUCT
@@ -255,7 +466,7 @@ class ProductCollection(Resource):
     @api.doc("create_products")
     @api.response(400, "The posted data was not valid")
     @api.expect(create_model)
-    @api.marshal_with(product_model, code=201)
+    @api.response(201, "Product created", product_model)
     def post(self):
         """
         Creates a Product
@@ -270,7 +481,193 @@ class ProductCollection(Resource):
         location_url = api.url_for(
             ProductResource, product_id=product.id, _external=True
         )
-        return product.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+        return json_response(serialize_product(product), status.HTTP_201_CREATED, {"Location": location_url})
+
+
+######################################################################
+#  PATH: /products/suggest
+######################################################################
+@api.route("/products/suggest")
+class ProductSuggestions(Resource):
+    """Suggests Product names while a user types"""
+
+    @api.doc("suggest_products")
+    @api.response(400, "The prefix or limit was not valid")
+    @api.expect(suggest_args, validate=True)
+    @api.response(200, "Success", [suggestion_model])
+    @replicas.read_only
+    def get(self):
+        """
+        Suggests Product names
+
+        This endpoint returns the most liked Products whose name starts with
+        the prefix, ignoring case, for type-ahead in search boxes
+        """
+        args = suggest_args.parse_args()
+        prefix = args["prefix"].strip()
+        if not prefix:
+            abort(status.HTTP_400_BAD_REQUEST, "The prefix must not be empty")
+        limit = app.config["SUGGEST_SIZE_DEFAULT"] if args["limit"] is None else args["limit"]
+        if limit < 1:
+            abort(status.HTTP_400_BAD_REQUEST, "Limit must be a positive integer")
+        suggestions = Product.suggest(prefix, min(limit, app.config["SUGGEST_SIZE_MAX"]))
+        return json_response(suggestions, status.HTTP_200_OK)
+
+
+######################################################################
+#  PATH: /products/facets
+######################################################################
+@api.route("/products/facets")
+class ProductFacets(Resource):
+    """Aggregates of the Products that match a filter"""
+
+    @api.doc("facet_products")
+    @api.response(400, "The query parameters were not valid")
+    @api.expect(facet_args, validate=True)
+    @api.response(200, "Success", facets_model)
+    @replicas.read_only
+    def get(self):
+        """
+        Returns the facets of Products
+
+        This endpoint returns the total count, the count per category and
+        histograms of the prices and ratings of the Products that match the
+        filters and search, for the sidebar of a storefront
+        """
+        args = facet_args.parse_args()
+        facets = Product.facets(
+            price_bucket=app.config["FACET_PRICE_BUCKET"],
+            rating_bucket=app.config["FACET_RATING_BUCKET"],
+            text=args["q"],
+            **get_filters(args),
+        )
+        return json_response(facets, status.HTTP_200_OK)
+
+
+######################################################################
+#  PATH: /products/export
+######################################################################
+@api.route("/products/export")
+class ProductExport(Resource):
+    """Streams the whole catalog of Products"""
+
+    @api.doc("export_products")
+    @api.expect(export_args, validate=True)
+    @api.produces(["application/x-ndjson", "text/csv"])
+    @replicas.read_only
+    def get(self):
+        """
+        Exports all Products
+
+        This endpoint streams every Product that matches the filter query
+        parameters as NDJSON or CSV, without building the list in memory
+        """
+        app.logger.info("Request to export Products")
+        args = export_args.parse_args()
+        products = Product.stream_by_query(
+            batch_size=app.config["EXPORT_BATCH_SIZE"], **get_filters(args)
+        )
+        if args["format"] == "csv":
+            body, mimetype = csv_lines(products), "text/csv"
+        else:
+            body, mimetype = ndjson_lines(products), "application/x-ndjson"
+        return app.response_class(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment; filename=products.{args['format']}"},
+        )
+
+
+######################################################################
+#  PATH: /products/batch
+######################################################################
+@api.route("/products/batch")
+class ProductBatch(Resource):
+    """
+    ProductBatch class
+
+    Handles bulk operations on many Products at once
+    POST /products/batch - Creates a list of Products in one transaction
+    PATCH /products/batch?<filter> - Updates all Products that match the filter
+    DELETE /products/batch?<filter> - Deletes all Products that match the filter
+    """
+
+    # ------------------------------------------------------------------
+    # ADD MANY NEW PRODUCTS
+    # ------------------------------------------------------------------
+    @api.doc("create_products_batch")
+    @api.response(400, "None of the posted Products were valid")
+    @api.response(413, "Too many Products were posted")
+    @api.expect([create_model])
+    def post(self):
+        """
+        Creates a list of Products
+
+        This endpoint validates every Product in the posted list and creates
+        the valid ones in one transaction. Invalid Products are reported by
+        their index in the list.
+        """
+        app.logger.info("Request to create a batch of products")
+        data = api.payload
+        if not isinstance(data, list):
+            abort(status.HTTP_400_BAD_REQUEST, "The body must be a list of Products")
+        if len(data) > app.config["BATCH_SIZE_MAX"]:
+            abort(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"At most {app.config['BATCH_SIZE_MAX']} Products can be created at once",
+            )
+        products, errors = [], []
+        for index, item in enumerate(data):
+            try:
+                products.append(Product().deserialize(item))
+            except DataValidationError as error:
+                errors.append({"index": index, "message": str(error)})
+        if products:
+            Product.create_many(products)
+        app.logger.info("Created %d products, rejected %d", len(products), len(errors))
+        return {
+            "created": [serialize_product(product) for product in products],
+            "errors": errors,
+        }, status.HTTP_201_CREATED if products else status.HTTP_400_BAD_REQUEST
+
+    # ------------------------------------------------------------------
+    # UPDATE ALL MATCHING PRODUCTS
+    # ------------------------------------------------------------------
+    @api.doc("update_products_batch")
+    @api.response(400, "The posted changes or the filter were not valid")
+    @api.expect(filter_args, validate=True)
+    def patch(self):
+        """
+        Updates all Products that match a filter
+
+        This endpoint applies the changes in the body to every Product that
+        matches the filter query parameters with a single UPDATE statement
+        """
+        app.logger.info("Request to update a batch of products")
+        filters = get_required_filters()
+        changes = Product.validate_changes(api.payload)
+        count = Product.update_by_query(changes, **filters)
+        app.logger.info("Updated %d products matching %s", count, filters)
+        return {"count": count}, status.HTTP_200_OK
+
+    # ------------------------------------------------------------------
+    # DELETE ALL MATCHING PRODUCTS
+    # ------------------------------------------------------------------
+    @api.doc("delete_products_batch")
+    @api.response(400, "The filter was not valid")
+    @api.expect(filter_args, validate=True)
+    def delete(self):
+        """
+        Deletes all Products that match a filter
+
+        This endpoint deletes every Product that matches the filter query
+        parameters with a single DELETE statement
+        """
+        app.logger.info("Request to delete a batch of products")
+        filters = get_required_filters()
+        count = Product.delete_by_query(**filters)
+        app.logger.info("Deleted %d products matching %s", count, filters)
+        return {"count": count}, status.HTTP_200_OK
 
 
 ######################################################################
@@ -290,17 +687,16 @@ class LikeResource(Resource):
         This endpoint will like a Product
         """
         app.logger.info("Request to like a product")
-        product = Product.find(product_id)
-        if not product:
+        likes = Product.add_like(product_id, shards=app.config["LIKE_COUNTER_SHARDS"])
+        if likes is None:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Product with id '{product_id}' was not found.",
             )
-        product.like()
         app.logger.info(f"Product {product_id} got a like")
         return {
             "message": "The product got a like successfully",
-            "likes": product.likes,
+            "likes": likes,
         }, status.HTTP_200_OK
 
 
@@ -315,6 +711,175 @@ def abort(error_code: int, message: str):
     api.abort(error_code, message)
 
 
+def get_filters(args):
+    """Returns the filter query parameters that are set"""
+    return {key: args[key] for key in ProductFilter.FIELDS if args[key]}
+
+
+def get_fields(args):
+    """Returns the requested fields in product_model order, or None for all of them"""
+    if not args["fields"]:
+        return None
+    fields = {name.strip() for name in args["fields"].split(",")} - {""}
+    unknown = fields - set(product_model.resolved)
+    if unknown:
+        abort(status.HTTP_400_BAD_REQUEST, f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in product_model.resolved if name in fields)
+
+
+def get_products_by_ids(args, fields):
+    """Returns the response of a multi-get of Products in the requested order"""
+    if get_filters(args) or any(args[key] is not None for key in ("q", "sort", "limit", "cursor")):
+        abort(status.HTTP_400_BAD_REQUEST, "ids cannot be combined with filters, q, sort, limit or cursor")
+    try:
+        ids = list(dict.fromkeys(int(value) for value in args["ids"].split(",")))
+    except ValueError:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid ids: {args['ids']}")
+    if len(ids) > app.config["MULTI_GET_MAX"]:
+        abort(status.HTTP_400_BAD_REQUEST, f"At most {app.config['MULTI_GET_MAX']} ids can be requested at once")
+    products = Product.find_serialized_many(ids, serialize_product)
+    results = [products[product_id] for product_id in ids if product_id in products]
+    if fields:
+        results = [{name: product[name] for name in fields} for product in results]
+    headers = {}
+    missing = [str(product_id) for product_id in ids if product_id not in products]
+    if missing:
+        headers["X-Missing-Ids"] = ",".join(missing)
+    app.logger.info("Returning %d products, %d missing", len(results), len(missing))
+    return json_response(results, status.HTTP_200_OK, headers)
+
+
+def get_required_filters():
+    """Returns the filter query parameters, which must not be empty for bulk changes"""
+    filters = get_filters(filter_args.parse_args())
+    if not filters:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"At least one filter of {', '.join(ProductFilter.FIELDS)} is required",
+        )
+    return filters
+
+
+def json_response(data, code, headers=None):
+    """Returns a response with the data encoded as JSON"""
+    return app.response_class(dumps(data), status=code, headers=headers, mimetype="application/json")
+
+
+def not_modified(etag):
+    """Returns an empty 304 Not Modified response for the ETag"""
+    return app.response_class(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def update_product(product_id, changes):
+    """
+    Updates the columns of a Product, honoring the If-Match header
+
+    An If-Match header, even If-Match: *, fails with a 412 when the Product
+    does not exist, as no current version of it can match (RFC 9110 13.1.1).
+    """
+    versions = get_if_match_versions()
+    product = Product.update_by_id(product_id, changes, None if versions is ANY_VERSION else versions)
+    if not product:
+        if versions is None:
+            abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Product with id '{product_id}' was not found.",
+            )
+        if Product.find_version(product_id) is None:
+            abort(
+                status.HTTP_412_PRECONDITION_FAILED,
+                f"Product with id '{product_id}' does not exist to match {request.headers['If-Match']}.",
+            )
+        abort(
+            status.HTTP_412_PRECONDITION_FAILED,
+            f"Product with id '{product_id}' has changed since version {request.headers['If-Match']}.",
+        )
+    return json_response(serialize_product(product), status.HTTP_200_OK, {"ETag": quote_etag(str(product.version))})
+
+
+def get_if_match_versions():
+    """
+    Returns the versions listed in the If-Match header, ANY_VERSION for
+    If-Match: *, or None when there is no If-Match header
+    """
+    if not request.if_match:
+        return None
+    if request.if_match.star_tag:
+        return ANY_VERSION
+    return [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+
+
+def list_products(query, args):
+    """
+    Returns a page of Products, of PAGE_SIZE_DEFAULT when no limit is given,
+    narrowed down to the full-text search q if there is one
+    """
+    if args["q"] is not None:
+        query = Product.search(query, args["q"])
+    return paginate_products(query, args)
+
+
+def default_sort(args):
+    """Returns the sort order of a listing without sort: by relevance for searches, else by id"""
+    return "-rank" if args["q"] is not None else "id"
+
+
+def collection_etag(products, headers):
+    """Returns an ETag for a list of Products from their ids, versions and next cursor"""
+    digest = hashlib.sha1()
+    for product in products:
+        digest.update(f"{product.id}:{product.version},".encode())
+    digest.update(headers.get("X-Next-Cursor", "").encode())
+    return digest.hexdigest()
+
+
+def paginate_products(query, args):
+    """Returns a page of Products along with the headers linking to the next page"""
+    sort = args["sort"] or default_sort(args)
+    after = None
+    if args["cursor"]:
+        cursor_sort, after = decode_cursor(args["cursor"])
+        if args["sort"] and args["sort"] != cursor_sort:
+            abort(
+                status.HTTP_400_BAD_REQUEST,
+                f"Cursor was issued for sort '{cursor_sort}', not '{args['sort']}'",
+            )
+        sort = cursor_sort
+    limit = app.config["PAGE_SIZE_DEFAULT"] if args["limit"] is None else args["limit"]
+    if limit < 1:
+        abort(status.HTTP_400_BAD_REQUEST, "Limit must be a positive integer")
+    limit = min(limit, app.config["PAGE_SIZE_MAX"])
+
+    products, keyset = Product.paginate(query, sort, limit=limit, after=after)
+    headers = {}
+    if keyset is not None:
+        cursor = encode_cursor(sort, keyset)
+        params = request.args.to_dict()
+        params.update(cursor=cursor, limit=limit)
+        next_url = api.url_for(ProductCollection, _external=True, **params)
+        headers["X-Next-Cursor"] = cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return products, headers
+
+
+def ndjson_lines(products):
+    """Yields Products as lines of newline delimited JSON"""
+    for product in products:
+        yield dumps(serialize_product(product)) + b"\n"
+
+
+def csv_lines(products):
+    """Yields a header and Products as lines of CSV"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(product_model.resolved))
+    writer.writeheader()
+    for product in products:
+        writer.writerow(serialize_product(product))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
 def data_reset():
     """Removes all Products from the database"""
     Product.remove_all()
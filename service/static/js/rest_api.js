@@ -32,6 +32,11 @@ $(function () {
         $("#product_likes").val("");
     }
  
+    // Remembers the ETag (version) of the Product shown in the form
+    function remember_etag(res, xhr) {
+        etags[res.id] = xhr.getResponseHeader("ETag");
+    }
+
     // Updates the flash message area
     function flash_message(message) {
         $("#flash_message").empty();
@@ -39,6 +44,7 @@ $(function () {
     }
 
     let root = "/api/products"
+    let etags = {}
  
     // ****************************************
     // Create a Product
@@ -122,20 +128,30 @@ $(function () {
 
         $("#flash_message").empty();
         if (id != ""){
+            let headers = {}
+            if (etags[id]) {
+                headers["If-Match"] = etags[id]
+            }
             let ajax = $.ajax({
                     type: "PUT",
                     url: `/api/products/${id}`,
                     contentType: "application/json",
+                    headers: headers,
                     data: JSON.stringify(data)
                 })
     
-            ajax.done(function(res){
+            ajax.done(function(res, textStatus, xhr){
+                remember_etag(res, xhr)
                 update_form_data(res)
                 flash_message("Product has been updated!")
             });
     
             ajax.fail(function(res){
-                flash_message("Fail: Product " + id + " does not exist!")
+                if (res.status == 412) {
+                    flash_message("Fail: Product " + id + " was changed by someone else, retrieve it again!")
+                } else {
+                    flash_message("Fail: Product " + id + " does not exist!")
+                }
             });
         }else{
             clear_form_data()
@@ -161,8 +177,9 @@ $(function () {
                 data: ''
             })
 
-            ajax.done(function(res){
+            ajax.done(function(res, textStatus, xhr){
                 //alert(res.toSource())
+                remember_etag(res, xhr)
                 update_form_data(res)
                 flash_message("Success")
             });
@@ -258,43 +275,61 @@ $(function () {
         }
 
         $("#flash_message").empty();
+        $("#search_results").empty();
+        let table = '<table class="table table-striped" cellpadding="10">'
+        table += '<thead><tr>'
+        table += '<th class="col-md-2">ID</th>'
+        table += '<th class="col-md-2">Name</th>'
+        table += '<th class="col-md-2">Image URL</th>'
+        table += '<th class="col-md-2">Description</th>'
+        table += '<th class="col-md-2">Price</th>'
+        table += '<th class="col-md-2">Rating</th>'
+        table += '<th class="col-md-2">Category</th>'
+        table += '<th class="col-md-2">Status</th>'
+        table += '<th class="col-md-2">Likes</th>'
+        table += '</tr></thead><tbody></tbody></table>'
+        $("#search_results").append(table);
+        load_results(`${root}?${queryString}`, true)
+    });
+
+    // ****************************************
+    // Load the next page of search results
+    // ****************************************
+    $("#more-btn").click(function () {
+        $("#flash_message").empty();
+        load_results($(this).data("url"), false)
+    });
+
+    // Appends a page of Products to the search results and offers the next page
+    // when the response carries a cursor to it
+    function load_results(url, first) {
+        $("#more-btn").hide();
 
         let ajax = $.ajax({
             type: "GET",
-            url: `${root}?${queryString}`,
+            url: url,
             contentType: "application/json",
             data: ''
         })
 
-        ajax.done(function(res){
-            //alert(res.toSource())
-            $("#search_results").empty();
-            let table = '<table class="table table-striped" cellpadding="10">'
-            table += '<thead><tr>'
-            table += '<th class="col-md-2">ID</th>'
-            table += '<th class="col-md-2">Name</th>'
-            table += '<th class="col-md-2">Image URL</th>'
-            table += '<th class="col-md-2">Description</th>'
-            table += '<th class="col-md-2">Price</th>'
-            table += '<th class="col-md-2">Rating</th>'
-            table += '<th class="col-md-2">Category</th>'
-            table += '<th class="col-md-2">Status</th>'
-            table += '<th class="col-md-2">Likes</th>'
-            table += '</tr></thead><tbody>'
-            let firstProduct = "";
+        ajax.done(function(res, textStatus, xhr){
+            let rows = $("#search_results tbody");
+            let start = rows.children().length;
             for(let i = 0; i < res.length; i++) {
                 let product = res[i];
-                table +=  `<tr id="row_${i}"><td>${product.id}</td><td>${product.name}</td><td>${product.img_url}</td><td>${product.description}</td><td>${product.price}</td><td>${product.rating}</td><td>${product.category}</td><td>${product.status}</td><td>${product.likes}</td></tr>`;
-                if (i == 0) {
-                    firstProduct = product;
-                }
+                rows.append(`<tr id="row_${start + i}"><td>${product.id}</td><td>${product.name}</td><td>${product.img_url}</td><td>${product.description}</td><td>${product.price}</td><td>${product.rating}</td><td>${product.category}</td><td>${product.status}</td><td>${product.likes}</td></tr>`);
             }
-            table += '</tbody></table>';
-            $("#search_results").append(table);
 
             // copy the first result to the form
-            if (firstProduct != "") {
-                update_form_data(firstProduct)
+            if (first && res.length > 0) {
+                update_form_data(res[0])
+            }
+
+            let cursor = xhr.getResponseHeader("X-Next-Cursor");
+            if (cursor) {
+                let params = new URLSearchParams(url.split("?")[1] || "");
+                params.set("cursor", cursor);
+                $("#more-btn").data("url", `${root}?${params.toString()}`).show();
             }
 
             flash_message("Success")
@@ -303,6 +338,5 @@ $(function () {
         ajax.fail(function(res){
             flash_message(res.responseJSON.message)
         });
-
-    });
+    }
  }) 
\ No newline at end of file
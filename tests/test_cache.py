@@ -0,0 +1,114 @@
+"""
+Test cases for the Read-through Cache
+"""
+
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from service.common.cache import MISSING, Cache, CacheBackend, LRUCache, NullCache
+
+
+######################################################################
+#  C A C H E   T E S T   C A S E S
+######################################################################
+class TestCache(TestCase):
+    """Test Cases for the Read-through Cache"""
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        backend = LRUCache(max_size=2, ttl=60)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        self.assertEqual(backend.get("a"), 1)
+        backend.set("c", 3)
+        self.assertIs(backend.get("b"), MISSING)
+        self.assertEqual(backend.get("a"), 1)
+        self.assertEqual(backend.get("c"), 3)
+        self.assertEqual(len(backend), 2)
+        backend.delete("a")
+        self.assertIs(backend.get("a"), MISSING)
+        backend.clear()
+        self.assertEqual(len(backend), 0)
+
+    @patch("service.common.cache.time.monotonic")
+    def test_lru_cache_expires_entries(self, monotonic_mock):
+        """It should expire entries after the TTL"""
+        monotonic_mock.return_value = 100.0
+        backend = LRUCache(max_size=10, ttl=5)
+        backend.set("a", 1)
+        monotonic_mock.return_value = 104.0
+        self.assertEqual(backend.get("a"), 1)
+        monotonic_mock.return_value = 106.0
+        self.assertIs(backend.get("a"), MISSING)
+        self.assertEqual(len(backend), 0)
+
+    def test_null_cache(self):
+        """It should never store anything in the null backend"""
+        backend = NullCache()
+        backend.set("a", 1)
+        backend.delete("a")
+        backend.clear()
+        self.assertIs(backend.get("a"), MISSING)
+        self.assertEqual(len(backend), 0)
+
+    def test_backend_interface(self):
+        """It should require backends to implement the interface"""
+        self.assertRaises(TypeError, CacheBackend)
+
+        class PartialCache(CacheBackend):
+            """A backend that cannot delete"""
+
+            def get(self, key):
+                return MISSING
+
+            def set(self, key, value):
+                pass
+
+            def clear(self):
+                pass
+
+        self.assertRaises(TypeError, PartialCache)
+
+    def test_read_through(self):
+        """It should load values on a miss and count hits and misses"""
+        cache = Cache("test")
+        cache.backend = LRUCache()
+        loader = MagicMock(return_value={"id": 1})
+        self.assertEqual(cache.get_or_load(1, loader), {"id": 1})
+        self.assertEqual(cache.get_or_load(1, loader), {"id": 1})
+        loader.assert_called_once()
+        cache.invalidate(1)
+        cache.get_or_load(1, loader)
+        self.assertEqual(loader.call_count, 2)
+        self.assertEqual(cache.get_or_load(2, lambda: None), None)
+        self.assertEqual(
+            cache.stats(), {"backend": "LRUCache", "size": 1, "hits": 1, "misses": 3}
+        )
+        cache.clear()
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_read_through_many(self):
+        """It should load all of the missing values of many keys at once"""
+        cache = Cache("test")
+        cache.backend = LRUCache()
+        cache.get_or_load(2, lambda: "two")
+        loader = MagicMock(return_value={1: "one", 3: None})
+        self.assertEqual(cache.get_many_or_load([1, 2, 3, 4], loader), {1: "one", 2: "two"})
+        loader.assert_called_once_with([1, 3, 4])
+        loader.reset_mock()
+        self.assertEqual(cache.get_many_or_load([2, 1], loader), {2: "two", 1: "one"})
+        loader.assert_not_called()
+        self.assertEqual(cache.stats()["hits"], 3)
+        self.assertEqual(cache.stats()["misses"], 4)
+
+    def test_init_app(self):
+        """It should select the backend configured for the app"""
+        cache = Cache("test")
+        app = MagicMock(config={"CACHE_TYPE": "memory", "CACHE_MAX_SIZE": 5, "CACHE_TTL": 1})
+        cache.init_app(app)
+        self.assertIsInstance(cache.backend, LRUCache)
+        self.assertEqual(cache.backend.max_size, 5)
+        app.config["CACHE_TYPE"] = "none"
+        cache.init_app(app)
+        self.assertIsInstance(cache.backend, NullCache)
+        app.config["CACHE_TYPE"] = "redis"
+        self.assertRaises(ValueError, cache.init_app, app)
@@ -2,12 +2,14 @@
 CLI Command Extensions for Flask
 """
 import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
 # pylint: disable=unused-import
 from wsgi import app  # noqa: F401
-from service.common.cli_commands import db_create  # noqa: E402
+from service.common.cli_commands import db_create, db_upgrade, likes_rollup  # noqa: E402
+from service.models.models import db, DataValidationError, Product, Status  # noqa: E402
 
 
 class TestFlaskCLI(TestCase):
@@ -23,3 +25,103 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch('service.common.cli_commands.db')
+    @patch('service.common.cli_commands.Product')
+    def test_db_upgrade(self, product_mock, db_mock):
+        """It should call the db-upgrade command"""
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(db_upgrade)
+            self.assertEqual(result.exit_code, 0)
+            db_mock.create_all.assert_called_once()
+            product_mock.add_missing_columns.assert_called_once()
+            product_mock.create_indexes.assert_called_once()
+
+    @patch('service.common.cli_commands.ProductLikeShard')
+    def test_likes_rollup(self, shard_mock):
+        """It should call the likes-rollup command"""
+        shard_mock.rollup.return_value = 7
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(likes_rollup)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Rolled up 7 likes", result.output)
+
+    def test_products_import(self):
+        """It should import the valid products of CSV and NDJSON files"""
+        context = app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        db.session.query(Product).delete()
+        db.session.commit()
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "products.csv")
+            with open(csv_path, "w", encoding="utf-8") as file:
+                file.write(
+                    "id,name,img_url,description,price,rating,category,status,likes\n"
+                    "1,Shirt,https://example.com/1.jpg,,19.99,4.5,clothes,ACTIVE,3\n"
+                    "2,Shoes,https://example.com/2.jpg,Red shoes,cheap,4.5,shoes,ACTIVE,0\n"
+                    "3,Book,https://example.com/3.jpg,A book,5,,books,DISABLED,\n"
+                )
+            ndjson_path = os.path.join(directory, "products.ndjson")
+            with open(ndjson_path, "w", encoding="utf-8") as file:
+                file.write(
+                    '{"name": "Game", "img_url": "https://example.com/4.jpg", "price": 59.5, "likes": 2}\n'
+                    "\n"
+                    "not json\n"
+                )
+            runner = app.test_cli_runner()
+            result = runner.invoke(args=["products-import", "--chunk-size", "1", csv_path, ndjson_path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Imported 3 products and rejected 2", result.output)
+        self.assertIn("products.csv:3:", result.output)
+        self.assertIn("products.ndjson:3:", result.output)
+        products = {product.name: product for product in Product.all()}
+        self.assertEqual(sorted(products), ["Book", "Game", "Shirt"])
+        self.assertEqual(products["Shirt"].likes, 3)
+        self.assertIsNone(products["Shirt"].description)
+        self.assertEqual(products["Book"].status, Status.DISABLED)
+        self.assertEqual(products["Book"].price, 5.0)
+        self.assertEqual(products["Game"].likes, 2)
+        db.session.query(Product).delete()
+        db.session.commit()
+
+    def test_products_import_stopped(self):
+        """It should stop at the chunk the database rejects and report where to resume"""
+        context = app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        db.session.query(Product).delete()
+        db.session.commit()
+        import_many = Product.import_many
+
+        def reject_bad(products):
+            if any(product.name == "Bad" for product in products):
+                raise DataValidationError("value too long for type character varying(63)")
+            import_many(products)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "products.ndjson")
+            with open(path, "w", encoding="utf-8") as file:
+                for name in ["One", "Two", "Three", "Bad", "Five"]:
+                    file.write(f'{{"name": "{name}", "img_url": "https://example.com/1.jpg", "price": 1.5}}\n')
+            runner = app.test_cli_runner()
+            with patch.object(Product, "import_many", side_effect=reject_bad):
+                result = runner.invoke(args=["products-import", "--chunk-size", "2", path])
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn("products.ndjson:3: value too long", result.output)
+        self.assertIn("Imported 2 products before it", result.output)
+        self.assertEqual(sorted(product.name for product in Product.all()), ["One", "Two"])
+        db.session.query(Product).delete()
+        db.session.commit()
+
+    @patch("service.models.models.db.session.commit")
+    def test_products_import_failed(self, exception_mock):
+        """It should not import products on database error"""
+        exception_mock.side_effect = Exception()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "products.txt")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write('{"name": "Game", "img_url": "https://example.com/4.jpg", "price": 59.5}\n')
+            runner = app.test_cli_runner()
+            result = runner.invoke(args=["products-import", "--format", "ndjson", path])
+        self.assertNotEqual(result.exit_code, 0)
@@ -0,0 +1,120 @@
+"""
+Test cases for the gunicorn configuration
+"""
+
+import importlib.util
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from wsgi import app
+from service.models.models import db
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+MIB = 2**20
+
+
+def load_conf(**environ):
+    """Loads gunicorn.conf.py with environment variables and returns it as a module"""
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF_PATH)
+    module = importlib.util.module_from_spec(spec)
+    with patch.dict(os.environ, environ):
+        for name in ("WEB_CONCURRENCY", "GUNICORN_THREADS"):
+            if name not in environ:
+                os.environ.pop(name, None)
+        spec.loader.exec_module(module)
+        module.exported = {name: os.environ[name] for name in ("WEB_CONCURRENCY", "GUNICORN_THREADS")}
+    return module
+
+
+######################################################################
+#  G U N I C O R N   C O N F I G   T E S T   C A S E S
+######################################################################
+class TestGunicornConf(TestCase):
+    """Test Cases for the gunicorn configuration"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.conf = load_conf()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.root = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, path, value):
+        """Writes a cgroup file under the fake cgroup root"""
+        path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(f"{value}\n")
+
+    def test_cgroup_v2_limits(self):
+        """It should read the CPU and memory limits of cgroup v2"""
+        self.write("cpu.max", "50000 100000")
+        self.write("memory.max", 128 * MIB)
+        self.assertEqual(self.conf.cpu_limit(self.root), 0.5)
+        self.assertEqual(self.conf.memory_limit(self.root), 128 * MIB)
+        self.assertEqual(self.conf.available_cpus(self.root), 0.5)
+        self.write("cpu.max", "max 100000")
+        self.write("memory.max", "max")
+        self.assertIsNone(self.conf.cpu_limit(self.root))
+        self.assertIsNone(self.conf.memory_limit(self.root))
+        self.assertGreaterEqual(self.conf.available_cpus(self.root), 1)
+
+    def test_cgroup_v1_limits(self):
+        """It should read the CPU and memory limits of cgroup v1"""
+        self.write("cpu/cpu.cfs_quota_us", 200000)
+        self.write("cpu/cpu.cfs_period_us", 100000)
+        self.write("memory/memory.limit_in_bytes", 512 * MIB)
+        self.assertEqual(self.conf.cpu_limit(self.root), 2.0)
+        self.assertEqual(self.conf.memory_limit(self.root), 512 * MIB)
+        self.write("cpu/cpu.cfs_quota_us", -1)
+        self.write("memory/memory.limit_in_bytes", 9223372036854771712)
+        self.assertIsNone(self.conf.cpu_limit(self.root))
+        self.assertIsNone(self.conf.memory_limit(self.root))
+
+    def test_no_cgroup(self):
+        """It should use every CPU and memory without a cgroup"""
+        self.assertIsNone(self.conf.cpu_limit(self.root))
+        self.assertIsNone(self.conf.memory_limit(self.root))
+
+    def test_autotune(self):
+        """It should size the workers from the CPUs and memory of the container"""
+        self.assertEqual(
+            self.conf.autotune(0.5, 128 * MIB, {}), {"worker_class": "gthread", "workers": 1, "threads": 4}
+        )
+        self.assertEqual(self.conf.autotune(2, None, {})["workers"], 5)
+        self.assertEqual(self.conf.autotune(2, 128 * MIB, {})["workers"], 2)
+        self.assertEqual(self.conf.autotune(4, 32 * MIB, {})["workers"], 1)
+        self.assertEqual(self.conf.autotune(4, 256 * MIB, {"GUNICORN_WORKER_MEMORY": "128"})["workers"], 2)
+
+    def test_autotune_overrides(self):
+        """It should keep the settings of the environment"""
+        tuned = self.conf.autotune(0.5, 128 * MIB, {"WEB_CONCURRENCY": "3", "GUNICORN_THREADS": "1"})
+        self.assertEqual(tuned, {"worker_class": "sync", "workers": 3, "threads": 1})
+        tuned = self.conf.autotune(1, None, {"GUNICORN_WORKER_CLASS": "uvicorn.workers.UvicornWorker"})
+        self.assertEqual(tuned["worker_class"], "uvicorn.workers.UvicornWorker")
+
+    def test_settings(self):
+        """It should export the workers and threads for the connection pool"""
+        conf = load_conf(WEB_CONCURRENCY="2", GUNICORN_THREADS="8", GUNICORN_MAX_REQUESTS="500", PORT="9000")
+        self.assertEqual(conf.exported, {"WEB_CONCURRENCY": "2", "GUNICORN_THREADS": "8"})
+        self.assertEqual((conf.workers, conf.threads, conf.worker_class), (2, 8, "gthread"))
+        self.assertEqual((conf.max_requests, conf.max_requests_jitter), (500, 50))
+        self.assertEqual(conf.bind, "0.0.0.0:9000")
+        self.assertTrue(conf.preload_app)
+        self.assertFalse(load_conf(GUNICORN_PRELOAD="false").preload_app)
+
+    def test_post_fork(self):
+        """It should drop the connections that a worker inherits from the preloaded app"""
+        with app.app_context():
+            pool = db.engine.pool
+            worker = SimpleNamespace(app=SimpleNamespace(wsgi=lambda: app))
+            self.conf.post_fork(SimpleNamespace(cfg=SimpleNamespace(preload_app=False)), worker)
+            self.assertIs(db.engine.pool, pool)
+            self.conf.post_fork(SimpleNamespace(cfg=SimpleNamespace(preload_app=True)), worker)
+            self.assertIsNot(db.engine.pool, pool)
@@ -7,7 +7,9 @@ import logging
 from unittest import TestCase
 from unittest.mock import patch
 from wsgi import app
-from service.models.models import Product, db, DataValidationError
+from service.models.models import (
+    Product, ProductFilter, ProductLikeShard, Range, Status, db, cache, query_cache, DataValidationError
+)
 from tests.factories import ProductFactory
 
 DATABASE_URI = os.getenv(
@@ -39,8 +41,12 @@ class TestProduct(TestCase):
 
     def setUp(self):
         """This runs before each test"""
+        # pylint: disable=duplicate-code
+        db.session.query(ProductLikeShard).delete()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()
+        query_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -74,6 +80,22 @@ class TestProduct(TestCase):
         product = ProductFactory()
         self.assertRaises(DataValidationError, product.create)
 
+    def test_create_many_products(self):
+        """It should create many products in one transaction"""
+        products = ProductFactory.create_batch(5)
+        Product.create_many(products)
+        self.assertEqual(len(Product.all()), 5)
+        for product in products:
+            found = Product.find(product.id)
+            self.assertEqual(found.name, product.name)
+            self.assertEqual(found.likes, 0)
+
+    @patch("service.models.models.db.session.commit")
+    def test_create_many_products_failed(self, exception_mock):
+        """It should not create many products on database error"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Product.create_many, ProductFactory.create_batch(2))
+
     @patch("service.models.models.db.session.commit")
     def test_update_product_failed(self, exception_mock):
         """It should not update a product on database error"""
@@ -116,6 +138,58 @@ class TestProduct(TestCase):
         product.like()
         self.assertEqual(product.likes, initial_likes + 1)
 
+    def test_like_product_many_times(self):
+        """It should count every Like of a Product in the database"""
+        product = ProductFactory()
+        product.create()
+        for _ in range(3):
+            Product.add_like(product.id)
+        product.like()
+        self.assertEqual(product.likes, 4)
+        self.assertEqual(Product.find(product.id).likes, 4)
+
+    def test_like_a_missing_product(self):
+        """It should not Like a Product that does not exist"""
+        self.assertIsNone(Product.add_like(0))
+        product = ProductFactory()
+        product.create()
+        product_id = product.id
+        db.session.query(Product).filter(Product.id == product_id).delete()
+        db.session.commit()
+        self.assertRaises(DataValidationError, product.like)
+
+    @patch("service.models.models.db.session.commit")
+    def test_like_product_failed(self, exception_mock):
+        """It should not Like a Product on database error"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Product.add_like, 1)
+
+    def test_like_product_sharded(self):
+        """It should count sharded Likes and roll them up into the Product"""
+        product = ProductFactory()
+        product.create()
+        for count in range(1, 6):
+            self.assertEqual(Product.add_like(product.id, shards=3), count)
+        self.assertEqual(Product.find(product.id).likes, 0)
+        self.assertEqual(ProductLikeShard.rollup(), 5)
+        db.session.expire_all()
+        self.assertEqual(Product.find(product.id).likes, 5)
+        self.assertEqual(db.session.query(ProductLikeShard).count(), 0)
+        self.assertEqual(Product.add_like(product.id, shards=3), 6)
+        self.assertEqual(ProductLikeShard.rollup(), 1)
+        self.assertEqual(ProductLikeShard.rollup(), 0)
+
+    def test_like_missing_product_sharded(self):
+        """It should not add a sharded Like to a Product that does not exist"""
+        self.assertIsNone(Product.add_like(0, shards=3))
+        self.assertEqual(db.session.query(ProductLikeShard).count(), 0)
+
+    @patch("service.models.models.db.session.commit")
+    def test_rollup_likes_failed(self, exception_mock):
+        """It should not roll up Likes on database error"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, ProductLikeShard.rollup)
+
     def test_serialize_a_product(self):
         """It should serialize a Product"""
         product = ProductFactory()
@@ -225,6 +299,243 @@ class TestProduct(TestCase):
         self.assertEqual(len(products), 1)
         self.assertEqual(products[0].price, 100.0)
 
+    def test_filter_by_combined_query(self):
+        """It should filter products by all of the query parameters at once"""
+        ProductFactory(name="Blue Shirt", category="clothes", price=20.0, rating=4.0, status=Status.ACTIVE).create()
+        ProductFactory(name="Red Shirt", category="clothes", price=80.0, rating=4.0, status=Status.ACTIVE).create()
+        ProductFactory(name="Blue Shoes", category="shoes", price=20.0, rating=4.0, status=Status.ACTIVE).create()
+        ProductFactory(name="Blue Shirt", category="clothes", price=20.0, rating=1.0, status=Status.DISABLED).create()
+
+        products = Product.filter_by_query(category="clothes", price="-50", rating="3-", status="active")
+        self.assertEqual(len(products), 1)
+        self.assertEqual(products[0].name, "Blue Shirt")
+        self.assertEqual(len(Product.filter_by_query(name="shirt")), 3)
+        self.assertEqual(len(Product.filter_by_query(name="blue", likes="0")), 3)
+        self.assertEqual(len(Product.filter_by_query(name="blue", likes="1-")), 0)
+        self.assertEqual(len(Product.filter_by_query(name="%")), 0)
+        self.assertEqual(len(Product.filter_by_query(status="DISABLED", category=None)), 1)
+
+    def test_filter_bad_query(self):
+        """It should not filter products by bad query parameters"""
+        for query in [
+            {"price": "cheap"},
+            {"rating": "4-2"},
+            {"likes": "-"},
+            {"status": "sold"},
+            {"color": "blue"},
+        ]:
+            self.assertRaises(DataValidationError, Product.filter_by_query, **query)
+
+    def test_parse_filter_is_cached(self):
+        """It should parse equivalent query parameters into the same cached filter"""
+        first = ProductFilter.from_query(price=" 10-20", category="books")
+        second = ProductFilter.from_query(category="books", price="10-20", rating="")
+        self.assertIs(first, second)
+        self.assertEqual(first.price, Range(10.0, 20.0))
+
+    def test_create_indexes(self):
+        """It should create the missing indexes on an existing table"""
+        index = next(index for index in Product.__table__.indexes if index.name == "ix_product_likes_id")
+        index.drop(db.engine)
+        Product.create_indexes()
+        names = {index["name"] for index in db.inspect(db.engine).get_indexes("product")}
+        self.assertIn("ix_product_likes_id", names)
+        self.assertIn("ix_product_price_id", names)
+
+    def test_add_missing_columns(self):
+        """It should add the missing columns to an existing table"""
+        product = ProductFactory()
+        product.create()
+        with db.engine.begin() as connection:
+            connection.execute(db.text("ALTER TABLE product DROP COLUMN version"))
+        Product.add_missing_columns()
+        Product.add_missing_columns()
+        columns = {column["name"] for column in db.inspect(db.engine).get_columns("product")}
+        self.assertIn("version", columns)
+        self.assertEqual(Product.find_version(product.id), 1)
+
+    def test_version(self):
+        """It should increment the version of a product on every change"""
+        product = ProductFactory()
+        product.create()
+        self.assertEqual(product.version, 1)
+        self.assertEqual(Product.find_version(product.id), 1)
+        product.name = "Changed"
+        product.update()
+        self.assertEqual(Product.find_version(product.id), 2)
+        product.like()
+        self.assertEqual(product.version, 3)
+        Product.update_by_query({"price": 1.0}, name="Changed")
+        self.assertEqual(Product.find_version(product.id), 4)
+        self.assertIsNone(Product.find_version(0))
+
+    def test_validate_changes(self):
+        """It should validate only the attributes that are changed"""
+        changes = Product.validate_changes({"price": 5, "status": "disabled", "description": None})
+        self.assertEqual(changes, {"price": 5.0, "status": Status.DISABLED, "description": None})
+        for data in [
+            [],
+            {},
+            {"likes": 3},
+            {"id": 3},
+            {"name": None},
+            {"name": 7},
+            {"price": "free"},
+            {"price": -1},
+            {"rating": 11},
+            {"status": "sold"},
+            {"status": None},
+        ]:
+            self.assertRaises(DataValidationError, Product.validate_changes, data)
+
+    def test_update_by_id(self):
+        """It should update a product in one statement when its version matches"""
+        product = ProductFactory(price=10.0)
+        product.create()
+        updated = Product.update_by_id(product.id, {"price": 5.0}, versions=[1])
+        self.assertEqual((updated.price, updated.version), (5.0, 2))
+        self.assertIsNone(Product.update_by_id(product.id, {"price": 1.0}, versions=[1]))
+        self.assertIsNone(Product.update_by_id(0, {"price": 1.0}))
+        updated = Product.update_by_id(product.id, {"price": 1.0})
+        self.assertEqual((updated.price, updated.version), (1.0, 3))
+
+    @patch("service.models.models.db.session.commit")
+    def test_update_by_id_failed(self, exception_mock):
+        """It should not update a product by id on database error"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Product.update_by_id, 1, {"price": 1.0})
+
+    def test_update_and_delete_by_query(self):
+        """It should update and delete all products that match a query"""
+        for category in ["books", "books", "games"]:
+            ProductFactory(category=category, price=10.0).create()
+        self.assertEqual(Product.update_by_query({"price": 7.5}, category="books"), 2)
+        self.assertEqual(sorted(p.price for p in Product.all()), [7.5, 7.5, 10.0])
+        self.assertEqual(Product.delete_by_query(price="-8"), 2)
+        self.assertEqual([p.category for p in Product.all()], ["games"])
+
+    @patch("service.models.models.db.session.commit")
+    def test_update_and_delete_by_query_failed(self, exception_mock):
+        """It should not update or delete products by query on database error"""
+        exception_mock.side_effect = Exception()
+        self.assertRaises(DataValidationError, Product.update_by_query, {"price": 1.0}, category="books")
+        self.assertRaises(DataValidationError, Product.delete_by_query, category="books")
+
+    def test_read_rows(self):
+        """It should read products as rows without loading Product instances"""
+        products = [ProductFactory(category="books"), ProductFactory(category="games")]
+        for product in products:
+            product.create()
+        expected = [(product.id, product.name, product.status) for product in products]
+        db.session.expunge_all()
+        row = Product.find_row(expected[0][0])
+        self.assertNotIsInstance(row, Product)
+        self.assertEqual((row.id, row.name, row.status), expected[0])
+        self.assertIsNone(Product.find_row(0))
+        rows = list(Product.stream_by_query(batch_size=1, category="games"))
+        self.assertEqual([row.id for row in rows], [expected[1][0]])
+        rows, _ = Product.paginate(Product.select_by(), "id", limit=None)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(len(db.session.identity_map), 0)
+
+    def test_search_products(self):
+        """It should search products by the words of their name and description"""
+        Product.create_indexes()
+        for name, description in [
+            ("Red shoe", "A red running shoe, red all over"),
+            ("Blue shoe", "A shoe"),
+            ("Red hat", "A hat"),
+        ]:
+            ProductFactory(name=name, description=description).create()
+        rows, _ = Product.paginate(Product.search(Product.select_by(), "red"), "-rank", limit=None)
+        self.assertEqual([row.name for row in rows], ["Red shoe", "Red hat"])
+        self.assertGreater(rows[0].rank, rows[1].rank)
+        rows, _ = Product.paginate(Product.search(Product.select_by(), "shoe, red!"), "-rank", limit=None)
+        self.assertEqual([row.name for row in rows], ["Red shoe"])
+
+        # the search index follows changes and deletes
+        product = Product.filter_by_query(name="Blue shoe")[0]
+        product.name = "Red boot"
+        product.update()
+        Product.filter_by_query(name="Red hat")[0].delete()
+        rows, _ = Product.paginate(Product.search(Product.select_by(), "red"), "name", limit=None)
+        self.assertEqual([row.name for row in rows], ["Red boot", "Red shoe"])
+        self.assertRaises(DataValidationError, Product.search, Product.select_by(), " -- ")
+        self.assertRaises(DataValidationError, Product.paginate, Product.select_by(), "rank")
+
+    def test_suggest_products(self):
+        """It should suggest the most liked products whose name starts with a prefix"""
+        for name, likes in [("Garden chair", 5), ("garden table", 9), ("Gardening kit", 1), ("Chair", 50), ("100%_x", 2)]:
+            ProductFactory(name=name, likes=likes).create()
+        names = [suggestion["name"] for suggestion in Product.suggest("GARDEN", limit=2)]
+        self.assertEqual(names, ["garden table", "Garden chair"])
+        self.assertEqual([s["name"] for s in Product.suggest("100%_")], ["100%_x"])
+        self.assertEqual(Product.suggest("1000"), [])
+        self.assertEqual(Product.suggest("%"), [])
+
+        # suggestions are cached until the next write
+        hits = query_cache.hits
+        Product.suggest("garden", limit=2)
+        self.assertEqual(query_cache.hits, hits + 1)
+        Product.add_like(Product.filter_by_query(name="Gardening")[0].id)
+        self.assertEqual(query_cache.stats()["size"], 0)
+
+    def test_facet_products(self):
+        """It should count the products per category and price and rating bucket"""
+        for category, price, rating in [
+            ("books", 10.0, 4.5), ("books", 49.99, 4.0), ("books", 75.0, 1.0), ("games", 50.0, 9.9), (None, 120.0, 0.0),
+        ]:
+            ProductFactory(category=category, price=price, rating=rating, name="Item", description="Item").create()
+        facets = Product.facets(price_bucket=50.0, rating_bucket=2.0)
+        self.assertEqual(facets["total"], 5)
+        self.assertEqual(
+            facets["categories"],
+            [{"value": "books", "count": 3}, {"value": None, "count": 1}, {"value": "games", "count": 1}],
+        )
+        self.assertEqual(
+            facets["price"],
+            [
+                {"min": 0.0, "max": 50.0, "count": 2},
+                {"min": 50.0, "max": 100.0, "count": 2},
+                {"min": 100.0, "max": 150.0, "count": 1},
+            ],
+        )
+        self.assertEqual([bucket["count"] for bucket in facets["rating"]], [2, 2, 1])
+        self.assertEqual([bucket["min"] for bucket in facets["rating"]], [0.0, 4.0, 8.0])
+
+        facets = Product.facets(category="books", price="-50")
+        self.assertEqual(facets["total"], 2)
+        self.assertEqual(facets["categories"], [{"value": "books", "count": 2}])
+        self.assertEqual(Product.facets(text="item", rating="9-")["total"], 1)
+        self.assertEqual(Product.facets(text="nothing")["total"], 0)
+        self.assertRaises(DataValidationError, Product.facets, color="red")
+
+        # facets are cached until the next write
+        self.assertEqual(Product.facets(price="-50")["total"], 3)
+        hits = query_cache.hits
+        self.assertEqual(Product.facets(price="-50")["total"], 3)
+        self.assertEqual(query_cache.hits, hits + 1)
+        ProductFactory(category="games", price=5.0).create()
+        self.assertEqual(Product.facets(price="-50")["total"], 4)
+
+    def test_paginate_products(self):
+        """It should return a page of products and the keyset of the next page"""
+        for price in [30.0, 10.0, 20.0]:
+            ProductFactory(price=price).create()
+        products, keyset = Product.paginate(Product.select_by(), "price", limit=2)
+        self.assertEqual([product.price for product in products], [10.0, 20.0])
+        self.assertEqual(keyset, [20.0, products[1].id])
+        products, keyset = Product.paginate(Product.select_by(), "price", limit=2, after=keyset)
+        self.assertEqual([product.price for product in products], [30.0])
+        self.assertIsNone(keyset)
+
+    def test_paginate_bad_keyset(self):
+        """It should not paginate with a bad sort key or keyset"""
+        query = Product.select_by()
+        self.assertRaises(DataValidationError, Product.paginate, query, "img_url")
+        self.assertRaises(DataValidationError, Product.paginate, query, "price", after=[1])
+        self.assertRaises(DataValidationError, Product.paginate, query, "name", after=[5, 1])
+
     ######################################################################
     #  D A T A   V A L I D A T I O N   T E S T   C A S E S
     ######################################################################
@@ -0,0 +1,121 @@
+"""
+Test cases for routing reads to the read replicas
+"""
+
+import logging
+import os
+import tempfile
+from unittest import TestCase
+from sqlalchemy import create_engine
+from wsgi import app
+from service.common import status
+from service.common.replicas import ReplicaRouter, replica_engine
+from service.models.models import db, cache, query_cache, replicas, Product
+from tests.factories import ProductFactory
+
+BASE_URL = "/api/products"
+
+
+######################################################################
+#  R E P L I C A   T E S T   C A S E S
+######################################################################
+class TestReplicas(TestCase):
+    """Test Cases for routing reads to the read replicas"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+        app.app_context().push()
+
+    def setUp(self):
+        """Creates a replica that holds other products than the primary"""
+        self.client = app.test_client()
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.replica = create_engine(f"sqlite:///{os.path.join(self.directory.name, 'replica.db')}")
+        db.metadata.create_all(self.replica, tables=[Product.__table__])
+        with self.replica.begin() as connection:
+            connection.execute(Product.__table__.insert(), [{**self.row("On the replica"), "id": 1}])
+        db.session.query(Product).delete()
+        db.session.commit()
+        ProductFactory(id=1, name="On the primary").create()
+        cache.clear()
+        query_cache.clear()
+        replicas.engines = [self.replica]
+        replicas.reads.clear()
+
+    def tearDown(self):
+        """Routes all reads back to the primary"""
+        replicas.engines = []
+        db.session.remove()
+        self.replica.dispose()
+        self.directory.cleanup()
+
+    @staticmethod
+    def row(name):
+        """Returns the columns of a product row with a name"""
+        product = ProductFactory(name=name)
+        return {"name": product.name, "img_url": product.img_url, "price": product.price, "likes": 0}
+
+    def get_names(self, **kwargs):
+        """Returns the names of the listed products"""
+        response = self.client.get(BASE_URL, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product["name"] for product in response.get_json()]
+
+    def test_read_from_replica(self):
+        """It should read the read-only endpoints from a replica"""
+        self.assertEqual(self.get_names(), ["On the replica"])
+        response = self.client.get(f"{BASE_URL}/1")
+        self.assertEqual(response.get_json()["name"], "On the replica")
+        self.assertEqual(replicas.stats(), [{"host": self.replica.url.database, "healthy": True, "reads": 2}])
+        self.assertIsNone(replica_engine.get())
+
+    def test_read_from_primary(self):
+        """It should read from the primary when a request asks for it or after a write"""
+        self.assertEqual(self.get_names(headers={"X-Read-From": "primary"}), ["On the primary"])
+        response = self.client.post(BASE_URL, json=ProductFactory(name="New").serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn("read_from=primary", response.headers["Set-Cookie"])
+        self.assertEqual(sorted(self.get_names()), ["New", "On the primary"])
+        self.client.delete_cookie("read_from")
+        self.assertEqual(self.get_names(), ["On the replica"])
+
+    def test_read_own_write_past_cache(self):
+        """It should read a product from the primary after a write, even when another client cached it"""
+        product_id = db.session.query(Product.id).scalar()
+        with self.replica.begin() as connection:
+            connection.execute(Product.__table__.update().values(id=product_id))
+        url = f"{BASE_URL}/{product_id}"
+        product = self.client.get(url, headers={"X-Read-From": "primary"}).get_json()
+        response = self.client.put(url, json={**product, "name": "Renamed"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # another client reads the lagging replica, which must not fill the cache
+        other = app.test_client()
+        self.assertEqual(other.get(url).get_json()["name"], "On the replica")
+        self.assertEqual(cache.stats()["size"], 0)
+        self.assertEqual(self.client.get(url).get_json()["name"], "Renamed")
+        self.assertEqual(other.get(url, headers={"X-Read-From": "primary"}).get_json()["name"], "Renamed")
+
+        # pinned reads skip entries cached before the write
+        cache.backend.set(product_id, {**product, "name": "Stale"})
+        self.assertEqual(self.client.get(url).get_json()["name"], "Renamed")
+        self.assertEqual(other.get(url).get_json()["name"], "Renamed")
+
+    def test_replica_down(self):
+        """It should read from the primary when no replica is healthy"""
+        replicas.engines = [create_engine(f"sqlite:///{self.directory.name}/missing/replica.db")]
+        self.assertEqual(self.get_names(), ["On the primary"])
+        self.assertFalse(replicas.stats()[0]["healthy"])
+        replicas.engines[0].dispose()
+
+    def test_round_robin(self):
+        """It should spread reads over the healthy replicas in turn"""
+        router = ReplicaRouter()
+        router.engines = [self.replica, create_engine("sqlite://"), self.replica]
+        chosen = [router.choose() for _ in range(4)]
+        self.assertEqual(chosen, [self.replica, router.engines[1], self.replica, self.replica])
+        self.assertEqual([replica["reads"] for replica in router.stats()], [3, 1, 3])
+        self.assertIsNone(ReplicaRouter().choose())
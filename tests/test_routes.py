@@ -3,12 +3,15 @@ TestProduct API Service Test Suite
 """
 
 import os
+import csv
+import json
 import logging
 from unittest import TestCase
 from urllib.parse import quote_plus
+from sqlalchemy import event
 from wsgi import app
 from service.common import status
-from service.models.models import db, Product, Status
+from service.models.models import db, cache, query_cache, Product, ProductLikeShard, Status
 from tests.factories import ProductFactory
 
 
@@ -44,8 +47,12 @@ class TestProductService(TestCase):
     def setUp(self):
         """Runs before each test"""
         self.client = app.test_client()
+        # pylint: disable=duplicate-code
+        db.session.query(ProductLikeShard).delete()
         db.session.query(Product).delete()  # clean up the last tests
         db.session.commit()
+        cache.clear()
+        query_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -78,6 +85,16 @@ class TestProductService(TestCase):
         data = resp.get_json()
         self.assertEqual(data["status"], "OK")
 
+    def test_stats(self):
+        """It should get the runtime statistics"""
+        resp = self.client.get("/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertIn("hits", data["cache"]["products"])
+        self.assertIn("misses", data["cache"]["products"])
+        self.assertIn("hits", data["cache"]["queries"])
+        self.assertIn("checkouts", data["pool"])
+
     def test_index(self):
         """It should call the home page"""
         resp = self.client.get("/")
@@ -147,6 +164,20 @@ class TestProductService(TestCase):
         self.assertEqual(len(data), 3)
         for product in data:
             self.assert_is_product(product)
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_list_products_default_page(self):
+        """It should Get only the first page of Products when no limit is given"""
+        products = self._create_products(3)
+        app.config["PAGE_SIZE_DEFAULT"] = 2
+        try:
+            response = self.client.get(BASE_URL)
+            self.assertEqual([product["id"] for product in response.get_json()], [products[0].id, products[1].id])
+            self.assertIn("limit=2", response.headers["Link"])
+            response = self.client.get(f"{BASE_URL}?cursor={response.headers['X-Next-Cursor']}")
+        finally:
+            app.config["PAGE_SIZE_DEFAULT"] = 20
+        self.assertEqual([product["id"] for product in response.get_json()], [products[2].id])
 
     def test_list_products_empty(self):
         """It should Get an empty list of Products"""
@@ -158,6 +189,188 @@ class TestProductService(TestCase):
         # validate the products
         self.assertEqual(len(data), 0)
 
+    def test_list_products_paginated(self):
+        """It should page through the Products with a cursor"""
+        products = self._create_products(5)
+        ids = []
+        url = f"{BASE_URL}?limit=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.get_json()
+            self.assertLessEqual(len(data), 2)
+            ids.extend(product["id"] for product in data)
+            cursor = response.headers.get("X-Next-Cursor")
+            url = f"{BASE_URL}?limit=2&cursor={cursor}" if cursor else None
+            if cursor:
+                self.assertIn('rel="next"', response.headers["Link"])
+                self.assertIn(f"cursor={cursor}", response.headers["Link"])
+        self.assertEqual(ids, sorted(product.id for product in products))
+
+    def test_list_products_paginated_by_sort_key(self):
+        """It should page through the Products sorted by price descending"""
+        for price in [10.0, 30.0, 20.0, 30.0]:
+            self.client.post(BASE_URL, json=ProductFactory(price=price).serialize())
+        response = self.client.get(f"{BASE_URL}?sort=-price&limit=3")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first_page = response.get_json()
+        self.assertEqual([product["price"] for product in first_page], [30.0, 30.0, 20.0])
+        self.assertGreater(first_page[0]["id"], first_page[1]["id"])
+        cursor = response.headers["X-Next-Cursor"]
+        response = self.client.get(f"{BASE_URL}?cursor={cursor}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product["price"] for product in response.get_json()], [10.0])
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+    def test_list_products_sorted(self):
+        """It should List all Products sorted by a sort key"""
+        self._create_products(4)
+        response = self.client.get(f"{BASE_URL}?sort=name")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [product["name"] for product in response.get_json()]
+        self.assertEqual(names, sorted(names))
+
+    def test_list_products_sparse_fields(self):
+        """It should List only the requested fields and select only their columns"""
+        self._create_products(3)
+        statements = []
+
+        def capture(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", capture)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", capture)
+        response = self.client.get(f"{BASE_URL}?fields=name, id,price&sort=-price&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(len(data), 2)
+        for product in data:
+            self.assertEqual(set(product), {"id", "name", "price"})
+        self.assertGreaterEqual(data[0]["price"], data[1]["price"])
+        self.assertNotIn("description", statements[-1])
+        self.assertNotIn("img_url", statements[-1])
+
+        response = self.client.get(f"{BASE_URL}?fields=id,secret,weight")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Unknown fields: secret, weight", response.get_json()["message"])
+
+    def test_search_products(self):
+        """It should Search Products by relevance and page through the results"""
+        for index, description in enumerate(["garden chair", "garden garden table", "kitchen table", "garden"]):
+            product = ProductFactory(name=f"Product {index}", description=description)
+            response = self.client.post(BASE_URL, json=product.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(f"{BASE_URL}?q=garden&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [product["name"] for product in response.get_json()]
+        self.assertEqual(len(names), 2)
+        cursor = response.headers["X-Next-Cursor"]
+        response = self.client.get(f"{BASE_URL}?q=garden&limit=2&cursor={cursor}")
+        names += [product["name"] for product in response.get_json()]
+        self.assertNotIn("X-Next-Cursor", response.headers)
+        self.assertEqual(sorted(names), ["Product 0", "Product 1", "Product 3"])
+
+        response = self.client.get(f"{BASE_URL}?q=table&category=&sort=name")
+        self.assertEqual([product["name"] for product in response.get_json()], ["Product 1", "Product 2"])
+        for query in ["q=%2B%2B", "sort=rank", "ids=1&q=garden"]:
+            response = self.client.get(f"{BASE_URL}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_products_pages(self):
+        """It should return every match of a search once across its pages"""
+        for index in range(7):
+            ProductFactory(name=f"Widget {index}", description="widget " * (index % 3 + 1)).create()
+        names, url = [], f"{BASE_URL}?q=widget&limit=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names += [product["name"] for product in response.get_json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            url = f"{BASE_URL}?q=widget&limit=3&cursor={cursor}" if cursor else None
+        self.assertEqual(sorted(names), [f"Widget {index}" for index in range(7)])
+
+    def test_facet_products(self):
+        """It should return the category counts and histograms of the filtered Products"""
+        for category, price in [("books", 10.0), ("books", 60.0), ("games", 20.0)]:
+            ProductFactory(category=category, price=price, rating=3.5, name="Board", description="Board").create()
+        response = self.client.get(f"{BASE_URL}/facets")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["total"], 3)
+        self.assertEqual(data["categories"], [{"value": "books", "count": 2}, {"value": "games", "count": 1}])
+        self.assertEqual(data["price"], [{"min": 0, "max": 50, "count": 2}, {"min": 50, "max": 100, "count": 1}])
+        self.assertEqual(data["rating"], [{"min": 3, "max": 4, "count": 3}])
+
+        response = self.client.get(f"{BASE_URL}/facets?category=books&q=board")
+        self.assertEqual(response.get_json()["total"], 2)
+        for query in ["price=abc", "q=%2B%2B"]:
+            response = self.client.get(f"{BASE_URL}/facets?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_suggest_products(self):
+        """It should Suggest the names of the most liked Products with a prefix"""
+        for name, likes in [("Lamp", 1), ("Lamp shade", 7), ("Table lamp", 9)]:
+            ProductFactory(name=name, likes=likes).create()
+        response = self.client.get(f"{BASE_URL}/suggest?prefix=lam")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([s["name"] for s in response.get_json()], ["Lamp shade", "Lamp"])
+        response = self.client.get(f"{BASE_URL}/suggest?prefix=lam&limit=1")
+        self.assertEqual(len(response.get_json()), 1)
+
+        # a new product shows up right away
+        self.client.post(BASE_URL, json=ProductFactory(name="Lampion").serialize())
+        response = self.client.get(f"{BASE_URL}/suggest?prefix=lam")
+        self.assertEqual(len(response.get_json()), 3)
+        for query in ["", "?prefix=%20", "?prefix=lam&limit=0"]:
+            response = self.client.get(f"{BASE_URL}/suggest{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_products_by_ids(self):
+        """It should Get many Products by id in the requested order"""
+        products = self._create_products(3)
+        ids = [products[2].id, 0, products[0].id, products[2].id, 999999]
+        # a client that did not write reads from the cache
+        reader = app.test_client()
+        reader.get(f"{BASE_URL}/{products[0].id}")
+        hits = cache.hits
+        response = reader.get(f"{BASE_URL}?ids={','.join(map(str, ids))}&fields=id,name")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.get_json(),
+            [{"id": product.id, "name": product.name} for product in [products[2], products[0]]],
+        )
+        self.assertEqual(response.headers["X-Missing-Ids"], "0,999999")
+        self.assertEqual(cache.hits, hits + 1)
+
+        response = self.client.get(f"{BASE_URL}?ids={products[1].id}")
+        self.assertEqual(len(response.get_json()), 1)
+        self.assertNotIn("X-Missing-Ids", response.headers)
+
+    def test_list_products_by_bad_ids(self):
+        """It should not Get many Products with bad or too many ids"""
+        for query in ["ids=1,x", "ids=", "ids=1&category=books", "ids=1&limit=2"]:
+            response = self.client.get(f"{BASE_URL}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        too_many = ",".join(str(number) for number in range(app.config["MULTI_GET_MAX"] + 1))
+        response = self.client.get(f"{BASE_URL}?ids={too_many}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("At most", response.get_json()["message"])
+
+    def test_list_products_bad_pagination(self):
+        """It should not List Products with a bad limit, cursor or sort key"""
+        self._create_products(3)
+        response = self.client.get(f"{BASE_URL}?limit=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}?sort=description&limit=2")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}?sort=price&limit=2")
+        cursor = response.headers["X-Next-Cursor"]
+        response = self.client.get(f"{BASE_URL}?sort=rating&cursor={cursor}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Cursor was issued for sort", response.get_json()["message"])
+
     def test_read_product(self):
         """It should Get a single Product"""
         # get the id of a product
@@ -168,6 +381,106 @@ class TestProductService(TestCase):
         self.assert_is_product(data)
         self.assert_two_products_are_the_same(data, test_product)
 
+    def test_read_product_sparse_fields(self):
+        """It should Get only the requested fields of a Product"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}?fields=id,name")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"id": test_product.id, "name": test_product.name})
+        self.assertEqual(response.headers["ETag"], '"1"')
+        response = self.client.get(f"{BASE_URL}/{test_product.id}?fields=id,")
+        self.assertEqual(response.get_json(), {"id": test_product.id})
+        response = self.client.get(f"{BASE_URL}/{test_product.id}?fields=color")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_read_product_cached(self):
+        """It should serve a Product from the cache until it changes"""
+        test_product = self._create_products(1)[0]
+        # the writes pin the reads of self.client past the cache, so another client reads
+        reader = app.test_client()
+        hits = cache.hits
+        for _ in range(2):
+            response = reader.get(f"{BASE_URL}/{test_product.id}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.hits, hits + 1)
+
+        # every kind of write invalidates the cached product
+        self.client.post(f"{BASE_URL}/{test_product.id}/like")
+        self.assertEqual(reader.get(f"{BASE_URL}/{test_product.id}").get_json()["likes"], 1)
+        data = reader.get(f"{BASE_URL}/{test_product.id}").get_json()
+        data["name"] = "Changed"
+        self.client.put(f"{BASE_URL}/{test_product.id}", json=data)
+        self.assertEqual(reader.get(f"{BASE_URL}/{test_product.id}").get_json()["name"], "Changed")
+        self.client.patch(f"{BASE_URL}/batch?name=Changed", json={"price": 1.0})
+        self.assertEqual(reader.get(f"{BASE_URL}/{test_product.id}").get_json()["price"], 1.0)
+        self.client.delete(f"{BASE_URL}/{test_product.id}")
+        response = reader.get(f"{BASE_URL}/{test_product.id}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_read_own_write_past_cache(self):
+        """It should read a Product past the cache after a write that another worker handled"""
+        test_product = self._create_products(1)[0]
+        url = f"{BASE_URL}/{test_product.id}"
+        reader = app.test_client()
+        self.assertEqual(reader.get(url).headers["ETag"], '"1"')
+
+        # the writer's change goes through another worker, which leaves the cache of this one alone
+        table = Product.__table__
+        db.session.execute(table.update().where(table.c.id == test_product.id).values(name="Changed", version=2))
+        db.session.commit()
+        self.assertEqual(reader.get(url).headers["ETag"], '"1"')
+
+        # the cookie of the writer pins its reads past the cache, and they refresh it
+        self.assertEqual(self.client.get(url).headers["ETag"], '"2"')
+        self.assertEqual(reader.get(url).headers["ETag"], '"2"')
+        db.session.execute(table.update().where(table.c.id == test_product.id).values(version=3))
+        db.session.commit()
+        self.assertEqual(reader.get(url, headers={"X-Read-From": "primary"}).headers["ETag"], '"3"')
+
+        # the cookie outlives the entries cached before the write
+        response = self.client.post(f"{url}/like")
+        self.assertIn(f"Max-Age={int(app.config['CACHE_TTL'])}", response.headers["Set-Cookie"])
+
+    def test_read_product_not_modified(self):
+        """It should answer a conditional Get with 304 until the Product changes"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, '"1"')
+        response = self.client.get(f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(response.data), 0)
+
+        self.client.post(f"{BASE_URL}/{test_product.id}/like")
+        response = self.client.get(f"{BASE_URL}/{test_product.id}", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["ETag"], '"2"')
+        self.assertEqual(response.get_json()["version"], 2)
+        response = self.client.get(f"{BASE_URL}/0", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_products_not_modified(self):
+        """It should answer a conditional list with 304 until a listed Product changes"""
+        products = self._create_products(3)
+        for url in [BASE_URL, f"{BASE_URL}?limit=2", f"{BASE_URL}?sort=-price&limit=2"]:
+            response = self.client.get(url)
+            etag = response.headers["ETag"]
+            self.assertTrue(etag.startswith('W/"'))
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.headers["ETag"], etag)
+
+        response = self.client.get(BASE_URL)
+        etag = response.headers["ETag"]
+        data = self.client.get(f"{BASE_URL}/{products[0].id}").get_json()
+        data["name"] = "Changed"
+        self.client.put(f"{BASE_URL}/{products[0].id}", json=data)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(len(response.get_json()), 3)
+
     def test_read_product_not_found(self):
         """It should not Get a Product thats not found"""
         response = self.client.get(f"{BASE_URL}/0")
@@ -208,6 +521,72 @@ class TestProductService(TestCase):
         updated_product = response.get_json()
         self.assertEqual(updated_product["category"], "unknown")
 
+    def test_update_product_if_match(self):
+        """It should only Update a Product whose version matches If-Match"""
+        test_product = self._create_products(1)[0]
+        response = self.client.get(f"{BASE_URL}/{test_product.id}")
+        etag = response.headers["ETag"]
+        data = response.get_json()
+        data["name"] = "First"
+        response = self.client.put(f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["ETag"], '"2"')
+        self.assertEqual(response.get_json()["version"], 2)
+
+        # a second editor still holding the old version is rejected
+        data["name"] = "Second"
+        response = self.client.put(f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertEqual(self.client.get(f"{BASE_URL}/{test_product.id}").get_json()["name"], "First")
+        response = self.client.put(f"{BASE_URL}/{test_product.id}", json=data, headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["name"], "Second")
+
+        # no version of a missing product matches, not even *
+        for if_match in [etag, "*"]:
+            response = self.client.put(f"{BASE_URL}/0", json=data, headers={"If-Match": if_match})
+            self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.patch(f"{BASE_URL}/0", json={"price": 1.0}, headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.put(f"{BASE_URL}/0", json=data)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patch_product(self):
+        """It should Update only the attributes of a Product that are sent"""
+        test_product = self._create_products(1)[0]
+        original = self.client.get(f"{BASE_URL}/{test_product.id}").get_json()
+        response = self.client.patch(
+            f"{BASE_URL}/{test_product.id}",
+            json={"price": 12.5, "description": None},
+            headers={"Content-Type": "application/merge-patch+json"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["price"], 12.5)
+        self.assertIsNone(data["description"])
+        self.assertEqual(data["version"], original["version"] + 1)
+        for key in ["name", "img_url", "rating", "category", "status", "likes"]:
+            self.assertEqual(data[key], original[key])
+
+        response = self.client.patch(
+            f"{BASE_URL}/{test_product.id}", json={"price": 1.0}, headers={"If-Match": '"1"'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.patch(f"{BASE_URL}/0", json={"price": 1.0})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_patch_product_with_invalid_data(self):
+        """It should not Update a Product with invalid or unknown attributes"""
+        test_product = self._create_products(1)[0]
+        for data in [{}, {"price": "free"}, {"name": None}, {"likes": 5}]:
+            response = self.client.patch(f"{BASE_URL}/{test_product.id}", json=data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_product_not_found(self):
+        """It should not Update a Product thats not found"""
+        response = self.client.put(f"{BASE_URL}/0", json=ProductFactory().serialize())
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_update_product_with_invalid_data(self):
         """It should not update as product as the data is invalid"""
         # create a product to update
@@ -241,6 +620,124 @@ class TestProductService(TestCase):
         for product in data:
             self.assertEqual(product["category"], test_category)
 
+    def test_query_by_multiple_filters(self):
+        """It should Query Products by several filters at once"""
+        for category, price in [("books", 10.0), ("books", 60.0), ("games", 10.0)]:
+            product = ProductFactory(category=category, price=price, status=Status.ACTIVE)
+            self.client.post(BASE_URL, json=product.serialize())
+        resp = self.client.get(BASE_URL, query_string="category=books&price=0-50&status=active")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]["category"], "books")
+        self.assertEqual(data[0]["price"], 10.0)
+
+    def test_query_bad_filter(self):
+        """It should not Query Products with a bad filter"""
+        resp = self.client.get(BASE_URL, query_string="price=a-b")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_products_batch(self):
+        """It should Create a batch of Products and report the invalid ones"""
+        payload = [ProductFactory().serialize() for _ in range(3)]
+        payload.insert(1, {"name": "No price"})
+        payload.append("not a product")
+        response = self.client.post(f"{BASE_URL}/batch", json=payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.get_json()
+        self.assertEqual(len(data["created"]), 3)
+        for product in data["created"]:
+            self.assert_is_product(product)
+        self.assertEqual([error["index"] for error in data["errors"]], [1, 4])
+        self.assertIn("missing img_url", data["errors"][0]["message"])
+        response = self.client.get(BASE_URL)
+        self.assertEqual(
+            sorted(product["id"] for product in response.get_json()),
+            sorted(product["id"] for product in data["created"]),
+        )
+
+    def test_create_products_batch_invalid(self):
+        """It should not Create a batch of Products that are all invalid"""
+        response = self.client.post(f"{BASE_URL}/batch", json=[{}, {"name": "x"}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.get_json()["errors"]), 2)
+        response = self.client.post(f"{BASE_URL}/batch", json={"name": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_products_batch_too_large(self):
+        """It should not Create a batch with more Products than allowed"""
+        app.config["BATCH_SIZE_MAX"] = 2
+        try:
+            payload = [ProductFactory().serialize() for _ in range(3)]
+            response = self.client.post(f"{BASE_URL}/batch", json=payload)
+        finally:
+            app.config["BATCH_SIZE_MAX"] = 1000
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_update_products_batch(self):
+        """It should Update all Products that match a filter"""
+        for category in ["books", "books", "games"]:
+            self.client.post(BASE_URL, json=ProductFactory(category=category).serialize())
+        response = self.client.patch(f"{BASE_URL}/batch?category=books", json={"price": 4.25})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 2)
+        response = self.client.get(f"{BASE_URL}?price=4.25")
+        self.assertEqual(len(response.get_json()), 2)
+
+    def test_update_products_batch_invalid(self):
+        """It should not Update a batch of Products with bad changes or no filter"""
+        response = self.client.patch(f"{BASE_URL}/batch?category=books", json={"price": "free"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f"{BASE_URL}/batch", json={"price": 1.0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("At least one filter", response.get_json()["message"])
+
+    def test_delete_products_batch(self):
+        """It should Delete all Products that match a filter"""
+        for category in ["books", "books", "games"]:
+            self.client.post(BASE_URL, json=ProductFactory(category=category).serialize())
+        response = self.client.delete(f"{BASE_URL}/batch?category=books")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["count"], 2)
+        response = self.client.get(BASE_URL)
+        self.assertEqual([product["category"] for product in response.get_json()], ["games"])
+        response = self.client.delete(f"{BASE_URL}/batch")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_products_ndjson(self):
+        """It should Export all Products as NDJSON"""
+        products = self._create_products(3)
+        response = self.client.get(f"{BASE_URL}/export")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        exported = [json.loads(line) for line in lines]
+        for product in exported:
+            self.assert_is_product(product)
+        self.assertEqual([product["id"] for product in exported], [product.id for product in products])
+
+    def test_export_products_csv(self):
+        """It should Export the Products that match a filter as CSV"""
+        for category in ["books", "books", "games"]:
+            self.client.post(BASE_URL, json=ProductFactory(category=category).serialize())
+        response = self.client.get(f"{BASE_URL}/export?format=csv&category=books")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "text/csv")
+        self.assertIn("products.csv", response.headers["Content-Disposition"])
+        rows = list(csv.DictReader(response.get_data(as_text=True).splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row["category"] for row in rows}, {"books"})
+        self.assertEqual(set(rows[0]), {"id", "name", "img_url", "description", "price",
+                                        "rating", "category", "status", "likes", "version"})
+
+    def test_export_products_bad_request(self):
+        """It should not Export Products in an unknown format or with a bad filter"""
+        response = self.client.get(f"{BASE_URL}/export?format=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/export?price=cheap")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_like_product(self):
         """It should increment the likes count of a product"""
         # create a product to like
@@ -266,6 +763,23 @@ class TestProductService(TestCase):
             "The likes count should be incremented",
         )
 
+    def test_like_product_sharded(self):
+        """It should count the likes of a product with sharded counters"""
+        product = self._create_products(1)[0]
+        app.config["LIKE_COUNTER_SHARDS"] = 4
+        try:
+            for count in range(1, 4):
+                response = self.client.post(f"{BASE_URL}/{product.id}/like")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.get_json()["likes"], count)
+            response = self.client.post(f"{BASE_URL}/0/like")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        finally:
+            app.config["LIKE_COUNTER_SHARDS"] = 0
+        ProductLikeShard.rollup()
+        response = self.client.get(f"{BASE_URL}/{product.id}")
+        self.assertEqual(response.get_json()["likes"], 3)
+
     def test_like_product_not_found(self):
         """It should return a HTTP 404 Not Found for a product that doesn't exist"""
         response = self.client.post(f"{BASE_URL}/0/like")
@@ -0,0 +1,82 @@
+"""
+Test cases for the precompiled serializers
+"""
+
+from types import SimpleNamespace
+from unittest import TestCase
+from flask_restx import Model, fields, marshal
+from sqlalchemy import Column, Enum, Float, Integer, MetaData, String, Table
+from service.common.serializer import compile_serializer, dumps
+from service.models.models import Status
+from tests.factories import ProductFactory
+
+METADATA = MetaData()
+
+ITEMS = Table(
+    "item",
+    METADATA,
+    Column("id", Integer, primary_key=True),
+    Column("title", String),
+    Column("score", Float),
+    Column("state", Enum(Status), nullable=False),
+    Column("stage", Enum(Status)),
+)
+
+ITEM_MODEL = Model(
+    "Item",
+    {
+        "id": fields.Integer(),
+        "name": fields.String(attribute="title"),
+        "score": fields.Float(default=0.0),
+        "state": fields.String(),
+        "stage": fields.String(),
+    },
+)
+
+
+######################################################################
+#  S E R I A L I Z E R   T E S T   C A S E S
+######################################################################
+class TestSerializer(TestCase):
+    """Test Cases for the precompiled serializers"""
+
+    def test_compile_serializer(self):
+        """It should serialize the fields of a model from the row attributes"""
+        serialize = compile_serializer(ITEM_MODEL, ITEMS)
+        row = SimpleNamespace(id=1, title="A", score=None, state=Status.ACTIVE, stage=None)
+        self.assertEqual(
+            serialize(row),
+            {"id": 1, "name": "A", "score": 0.0, "state": "ACTIVE", "stage": None},
+        )
+        row = SimpleNamespace(id=2, title=None, score=2.5, state=Status.DISABLED, stage=Status.ACTIVE)
+        self.assertEqual(
+            serialize(row),
+            {"id": 2, "name": None, "score": 2.5, "state": "DISABLED", "stage": "ACTIVE"},
+        )
+
+    def test_compile_serializer_for_fields(self):
+        """It should serialize only the requested fields"""
+        serialize = compile_serializer(ITEM_MODEL, ITEMS, ("id", "state"))
+        row = SimpleNamespace(id=1, state=Status.ACTIVE)
+        self.assertEqual(serialize(row), {"id": 1, "state": "ACTIVE"})
+
+    def test_serialize_like_marshal(self):
+        """It should serialize a Product the same as serialize() and marshal"""
+        model = Model(
+            "Product",
+            {
+                "id": fields.Integer(),
+                "name": fields.String(),
+                "price": fields.Float(),
+                "rating": fields.Float(default=0.0),
+                "status": fields.String(default=Status.ACTIVE.name),
+                "likes": fields.Integer(default=0),
+            },
+        )
+        product = ProductFactory(id=7, likes=3)
+        serialize = compile_serializer(model, product.__table__)
+        self.assertEqual(serialize(product), marshal(product.serialize(), model))
+
+    def test_dumps(self):
+        """It should encode data as compact JSON bytes"""
+        self.assertEqual(dumps([{"id": 1, "price": 9.5, "name": None}]), b'[{"id":1,"price":9.5,"name":null}]')
@@ -0,0 +1,82 @@
+"""
+Test cases for the startup of the app
+"""
+
+import logging
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine, exc
+from service import config, create_app
+from service.common.startup import StartupTimer, wait_for_database
+from service.models.models import db, pool_metrics, replicas
+
+RETRIES = {"RETRY_COUNT": 3, "RETRY_DELAY": 0, "RETRY_BACKOFF": 2, "RETRY_MAX_DELAY": 0}
+logger = logging.getLogger("tests.startup")
+logger.disabled = True
+
+
+def connection_error():
+    """Returns the error of a database that refuses connections"""
+    return exc.OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+
+######################################################################
+#  S T A R T U P   T E S T   C A S E S
+######################################################################
+class TestStartup(TestCase):
+    """Test Cases for the startup of the app"""
+
+    def test_startup_timer(self):
+        """It should time every phase of the startup"""
+        timer = StartupTimer()
+        with timer.phase("routes"):
+            pass
+        with timer.phase("database"):
+            pass
+        self.assertEqual(list(timer.phases), ["routes", "database"])
+        self.assertGreaterEqual(timer.total(), sum(timer.phases.values()))
+        self.assertRegex(timer.summary(), r"^Startup took \d+ ms \(routes \d+ ms, database \d+ ms\)$")
+
+    def test_wait_for_database(self):
+        """It should return as soon as the database accepts connections"""
+        engine = create_engine("sqlite://")
+        wait_for_database(engine, RETRIES, logger)
+        engine.dispose()
+
+    def test_wait_for_database_retries(self):
+        """It should try to connect again until the database is up"""
+        engine = MagicMock()
+        engine.connect.side_effect = [connection_error(), connection_error(), MagicMock()]
+        wait_for_database(engine, RETRIES, logger)
+        self.assertEqual(engine.connect.call_count, 3)
+
+    def test_wait_for_database_gives_up(self):
+        """It should raise the last error when every try fails"""
+        engine = MagicMock()
+        engine.connect.side_effect = connection_error()
+        self.assertRaises(exc.OperationalError, wait_for_database, engine, RETRIES, logger)
+        self.assertEqual(engine.connect.call_count, 3)
+
+        # a RETRY_COUNT of 0 still tries once
+        engine = MagicMock()
+        wait_for_database(engine, {**RETRIES, "RETRY_COUNT": 0}, logger)
+        engine.connect.assert_called_once()
+
+    @patch.object(replicas, "init_app")
+    @patch.object(pool_metrics, "listen")
+    def test_create_app_without_schema(self, *_):
+        """It should leave the schema to db-upgrade and the docs out when configured to"""
+        with patch.object(config, "DB_CREATE_ALL", False), patch.object(config, "API_DOCS", False), \
+                patch.object(db, "create_all") as create_all:
+            app = create_app()
+        create_all.assert_not_called()
+        self.assertNotIn("/apidocs/", [rule.rule for rule in app.url_map.iter_rules()])
+
+    @patch.object(replicas, "init_app")
+    @patch.object(pool_metrics, "listen")
+    @patch("service.wait_for_database", side_effect=connection_error())
+    def test_create_app_without_database(self, *_):
+        """It should exit with code 4 when the database never comes up"""
+        with self.assertRaises(SystemExit) as context:
+            create_app()
+        self.assertEqual(context.exception.code, 4)